@@ -1,37 +1,54 @@
+import click
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flasgger import Swagger
 from flask_cors import CORS
 
-app = Flask(__name__, instance_relative_config=True)
-CORS(app)
-#load the config file
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-
-#load the routes
-#from app import api
-
-swagger = Swagger(app, 
-        template={
-            "consumes":[
-                "application/json"
-            ],
-            "produces":[
-                "application/json"
-            ],
-            "Accept":[
-                "application/json"
-            ]
-        }
-)
-
-from .categories import mod
-from .auth import mod
-from .recipes import mod
-
-app.register_blueprint(categories.mod, url_prefix='/api-v0')
-app.register_blueprint(auth.mod, url_prefix='/api-v0')
-app.register_blueprint(recipes.mod, url_prefix='/api-v0')
+from .database import Database
+
+db = Database()
+
+
+def create_app(config=None):
+    """
+    Build an application.
+
+    config overrides the defaults of config.py, either a dict or the name of
+    a file of the instance folder (e.g 'testconf.cfg').
+    """
+    app = Flask(__name__, instance_relative_config=True)
+    CORS(app)
+    #load the config file
+    app.config.from_object('config')
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config:
+        app.config.from_pyfile(config)
+
+    db.init_app(app)
+    if click.get_current_context(silent=True) is not None:
+        # loaded by the flask command (`flask db upgrade`...), web workers never need alembic
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    #load the routes
+    from . import instrumentation, metrics, commands
+    from . import categories, auth, recipes, transfer
+    from .apidocs import LazyDocs
+    from .compression import Compress
+
+    instrumentation.init_app(app)
+    metrics.init_app(app)
+    commands.init_app(app)
+
+    app.register_blueprint(categories.mod, url_prefix='/api-v0')
+    app.register_blueprint(auth.mod, url_prefix='/api-v0')
+    app.register_blueprint(recipes.mod, url_prefix='/api-v0')
+    app.register_blueprint(transfer.mod, url_prefix='/api-v0')
+    app.wsgi_app = LazyDocs(app)
+    app.wsgi_app = Compress(app)
+    return app
+
+
+# the application served by `gunicorn app:app` and used by the tests
+app = create_app()
+# db.create_all() and friends work outside of an application context
+db.app = app
@@ -0,0 +1,158 @@
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from collections import namedtuple
+
+from flask import Flask
+from flask_cors import CORS
+from werkzeug.wrappers import Request, Response
+
+from .compression import mark_encoded
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SWAGGER_TEMPLATE = {
+    "consumes":[
+        "application/json"
+    ],
+    "produces":[
+        "application/json"
+    ],
+    "Accept":[
+        "application/json"
+    ]
+}
+
+# routes of the flasgger blueprint
+SPEC_PATH = '/apispec_1.json'
+DOCS_PATHS = ('/apidocs', SPEC_PATH, '/flasgger_static')
+
+Spec = namedtuple('Spec', 'body gzipped etag stamp')
+
+
+def swag_from(path):
+    """
+    Attach a docs/*.yml file to a view the way flasgger's swag_from does,
+    without importing flasgger. The file is only read when the spec is built.
+    """
+    def decorator(f):
+        f.swag_path = os.path.join(ROOT, path)
+        f.swag_type = path.rsplit('.', 1)[-1]
+        return f
+    return decorator
+
+
+def docs_stamp():
+    """Latest modification time of the docs/*.yml files (and of the folder, for added or removed files)."""
+    directory = os.path.join(ROOT, 'docs')
+    return max([os.path.getmtime(directory)] +
+               [os.path.getmtime(os.path.join(directory, name)) for name in os.listdir(directory)])
+
+
+def freeze_spec(body, stamp):
+    """Canonical JSON bytes of a spec with their gzip encoding and strong ETag."""
+    body = json.dumps(json.loads(body.decode('utf-8')), sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return Spec(body, gzip.compress(body, 9), hashlib.sha1(body).hexdigest(), stamp)
+
+
+class LazyDocs(object):
+    """
+    WSGI middleware serving the Swagger UI and spec.
+
+    The flasgger application is only built on the first request for the
+    docs, so workers that never serve them don't import flasgger (and its
+    yaml, jsonschema and markdown dependencies) at all.
+
+    The spec is compiled once into frozen JSON bytes, served with a strong
+    ETag, a long Cache-Control and precompressed gzip. It is recompiled when
+    the docs change, or loaded from the APISPEC_PATH file written by
+    `flask build-apispec` when that file is newer than the docs.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self._docs = None
+        self._spec = None
+        self._checked = 0
+        self._lock = threading.RLock()
+        app.extensions['apidocs'] = self
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == SPEC_PATH:
+            return self.serve_spec(environ, start_response)
+        if path.startswith(DOCS_PATHS):
+            return self.docs(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    @property
+    def spec_path(self):
+        return self.app.config.get('APISPEC_PATH') or os.path.join(self.app.instance_path, 'apispec_1.json')
+
+    @property
+    def spec(self):
+        """The frozen spec, recompiled when the docs changed since it was built."""
+        now = time.time()
+        if self._spec is None or now - self._checked >= self.app.config.get('APISPEC_CHECK_INTERVAL', 5):
+            with self._lock:
+                stamp = docs_stamp()
+                self._checked = now
+                if self._spec is None or self._spec.stamp != stamp:
+                    self._spec = self.load_spec(stamp)
+        return self._spec
+
+    def load_spec(self, stamp):
+        path = self.spec_path
+        if os.path.exists(path) and os.path.getmtime(path) >= stamp:
+            with open(path, 'rb') as f:
+                return freeze_spec(f.read(), stamp)
+        return freeze_spec(self.build_spec(), stamp)
+
+    def build_spec(self):
+        """Let flasgger assemble the spec from the docs, returns the JSON bytes."""
+        # flasgger describes the routes of current_app, the API rather than the docs
+        with self.app.test_request_context(SPEC_PATH):
+            return self.docs.view_functions['flasgger.apispec_1']().get_data()
+
+    def serve_spec(self, environ, start_response):
+        request = Request(environ)
+        spec = self.spec
+        if request.accept_encodings.quality('gzip'):
+            response = Response(spec.gzipped, mimetype='application/json')
+            response.set_etag(spec.etag)
+            # the gzip representation gets its own ETag (suffixed -gzip)
+            mark_encoded(response.headers, 'gzip', len(spec.gzipped))
+        else:
+            response = Response(spec.body, mimetype='application/json')
+            response.set_etag(spec.etag)
+            response.headers['Vary'] = 'Accept-Encoding'
+        etag = response.headers['ETag']
+        # the Compress middleware strips the -gzip suffix from If-None-Match
+        if request.if_none_match.contains_raw(etag) or spec.etag in request.if_none_match:
+            response = Response(status=304)
+            response.headers['ETag'] = etag
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'public, max-age={:d}'.format(self.app.config.get('APISPEC_MAX_AGE', 86400))
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response(environ, start_response)
+
+    @property
+    def docs(self):
+        if self._docs is None:
+            with self._lock:
+                if self._docs is None:
+                    self._docs = self.create_docs()
+        return self._docs
+
+    def create_docs(self):
+        from flasgger import Swagger
+
+        docs = Flask(__name__)
+        docs.debug = self.app.debug
+        CORS(docs)
+        Swagger(docs, template=SWAGGER_TEMPLATE)
+        return docs
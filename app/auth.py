@@ -1,22 +1,31 @@
 import datetime
 import jwt
 from json.decoder import JSONDecodeError
-from werkzeug.security import generate_password_hash, check_password_hash
-from flask import Blueprint, request, jsonify, make_response, json, url_for
-from flask_mail import Mail, Message 
+from flask import Blueprint, current_app, request, jsonify, make_response, json, url_for
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 
-from app import app, db, models
+from app import db, models
 
-from flasgger import swag_from
-from .helpers import token_required, check_password, check_mail, special_character, password_match
+from .apidocs import swag_from
+from .helpers import token_required, check_password, check_mail, special_character, password_match, invalidate_principal, violated_constraint
 from .serializers import UserSchema, LoginSchema
 from .models import User
+from .jobs import enqueue
+from .replicas import mark_written
+from .hashing import hash_password, verify_password, needs_rehash, HashingBusy
 
 mod = Blueprint('auth', __name__)
-mail = Mail(app)
 
-serializer = URLSafeTimedSerializer(app.secret_key)
+@mod.errorhandler(HashingBusy)
+def hashing_busy(error):
+    response = jsonify({'message': 'Server busy, please try again', 'status': False})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def reset_serializer():
+    return URLSafeTimedSerializer(current_app.secret_key)
 
 @mod.route('/auth/register', methods=['POST'])
 @swag_from('docs/auth_register.yml')
@@ -36,10 +45,23 @@ def register():
     if errors:
         return make_response(json.dumps({'errors': errors}), 422)
     
-    hashed_password = generate_password_hash(data['password'], method='sha256')
+    hashed_password = hash_password(data['password'])
     new_user = User(username=data['username'], email=data['email'], password=hashed_password)
-    new_user.save()
+    try:
+        new_user.save()
+    except IntegrityError as e:
+        db.session.rollback()
+        constraint = violated_constraint(e)
+        if constraint == 'users_email':
+            errors = {'email': ['A user with email "%s" already exists' % data['email']]}
+        elif constraint == 'users_username':
+            errors = {'username': ['A user with username "%s" already exists' % data['username']]}
+        else:
+            raise
+        return make_response(json.dumps({'errors': errors}), 422)
 
+    # replicas may not have the new user yet (the identity avoids reloading the expired row)
+    mark_written(inspect(new_user).identity[0])
     return make_response(json.dumps(user)), 201
 
 @mod.route('/auth/login', methods=['POST'])
@@ -58,13 +80,21 @@ def login():
         return make_response(json.dumps({'errors': errors})), 422
 
     user = User.query.filter_by(email=data['email']).first()
+    if not user:
+        return make_response(json.dumps({'errors': {'email': ['User does not exists.']}})), 422
     
-    if check_password_hash(user.password, data['password']):
+    if verify_password(user.password, data['password']):
+        if needs_rehash(user.password):
+            user.password = hash_password(data['password'])
+            user.save()
         token = jwt.encode(
             {
-                'email': user.email, 
+                'id': user.id,
+                'ver': user.token_version,
                 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=48)
-            }, app.secret_key)
+            }, current_app.secret_key)
+        # the first requests with the token look the user up on the primary
+        mark_written(user.id)
 
         return jsonify(
                 {
@@ -85,15 +115,16 @@ def forgot_password():
     user = User.query.filter_by(email=data['email']).first()
 
     if user:
-        token = serializer.dumps(user.email, salt='reset_salt')
+        token = reset_serializer().dumps(user.email, salt='reset_salt')
 
-        msg = Message('Chumvi: Reset password', sender='chumvi.api@gmail.com', recipients=[data['email']])
         # link = url_for('auth.reset_password', token=token, _external=True)
         link = 'https://chumvi-react.herokuapp.com/reset_password/{}'.format(token)
-        msg.body = 'Click on the link to reset password {}'.format(link)
-                    
-        mail.send(msg)       
-        return jsonify({'message': 'An email with a reset password link has been sent to {}'.format(data['email'])}), 200
+        enqueue('send_mail',
+                subject='Chumvi: Reset password',
+                sender='chumvi.api@gmail.com',
+                recipients=[data['email']],
+                body='Click on the link to reset password {}'.format(link))
+        return jsonify({'message': 'An email with a reset password link has been sent to {}'.format(data['email'])}), 202
 
     return jsonify({'message': 'User does not exists', 'status': False}), 404
 
@@ -102,7 +133,7 @@ def forgot_password():
 def reset_password(token):
     data = request.get_json()
     try:
-        email = serializer.loads(token,  salt='reset_salt', max_age=180)
+        email = reset_serializer().loads(token,  salt='reset_salt', max_age=180)
     except SignatureExpired:
         return jsonify({'message': 'Reset password token already expired', 'status': False}), 403
     except BadSignature:
@@ -112,8 +143,12 @@ def reset_password(token):
     if not password_match(data['password'], data['confirm_password']):
         return jsonify({'message': 'Passwords do not match', 'status': False }), 422
 
-    hashed_password = generate_password_hash(data['password'], method='sha256')
+    hashed_password = hash_password(data['password'])
     user.password = hashed_password
+    user.token_version = User.token_version + 1
+    # read before the commit expires it, or the id costs a reload
+    user_id = user.id
     user.save()
+    invalidate_principal(user_id)
 
     return jsonify({'message': 'Successfully reset password', 'status': True}), 201
@@ -0,0 +1,90 @@
+import time
+import threading
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+
+
+class LRUCache(object):
+    """
+    Thread safe LRU cache with a per entry expiry time.
+
+    Entries are evicted when they expire or when the cache grows past
+    `maxsize`, least recently used first.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key or default when missing/expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires = item
+            if expires <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for at most ttl seconds."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Drop every entry whose value matches predicate."""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ConfiguredLRUCache(LRUCache):
+    """
+    LRUCache sized by the config of the current application.
+
+    `size_key` and `ttl_key` name the settings, they are read on every write
+    (outside an application context the last values stay in use).
+    """
+
+    def __init__(self, size_key, ttl_key=None, maxsize=1024, ttl=300):
+        super(ConfiguredLRUCache, self).__init__(maxsize=maxsize, ttl=ttl)
+        self.size_key = size_key
+        self.ttl_key = ttl_key
+
+    def set(self, key, value, ttl=None):
+        if has_app_context():
+            config = current_app.config
+            self.maxsize = config.get(self.size_key, self.maxsize)
+            if self.ttl_key:
+                self.ttl = config.get(self.ttl_key, self.ttl)
+        super(ConfiguredLRUCache, self).set(key, value, ttl)
@@ -1,16 +1,39 @@
 import json
 from json.decoder import JSONDecodeError
-from flask import Blueprint, request, jsonify, make_response
-from flasgger import swag_from
+from flask import Blueprint, request, jsonify, make_response, Response, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from .apidocs import swag_from
 from app import db
 
-from .helpers import token_required, check_password, check_mail, special_character, category_exists
+from .helpers import token_required, check_password, check_mail, special_character, violated_constraint
 from .models import User, Category
 from .serializers import CategorySchema
+from .pagination import keyset_page, MAX_LIMIT
+from .etags import row_etag, list_etag, not_modified, with_etag
+from .response_cache import response_cache
 
 
 mod = Blueprint('categories', __name__)
 
+def category_to_dict(category):
+    """Serialize a category row."""
+    cat = {}
+    cat['id'] = category.id
+    cat['category_name'] = category.category_name
+    cat['category_description'] = category.category_description
+    return cat
+
+def stream_categories(user_id):
+    """Yield the user's categories as one JSON document, a row at a time."""
+    rows = db.session.query(Category.id, Category.category_name, Category.category_description)\
+        .filter(Category.user_id == user_id).order_by(Category.id).yield_per(500)
+    yield '{"categories": ['
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps(category_to_dict(row))
+        separator = ', '
+    yield ']}'
+
 @mod.route('/category', methods=['POST'])
 @token_required
 @swag_from('docs/category_post.yml')
@@ -31,39 +54,62 @@ def add_category(current_user):
     if errors:
         return make_response(json.dumps({'errors': errors, 'status': False})), 422
 
-    cat_exists = Category.query.filter(Category.category_name == data['category_name'].lower()).filter(Category.user_id == current_user.id).first()
-    if cat_exists:
-        return jsonify({
-                            'message': 'Sorry, Category already exists',
-                            'status': False
-                       }), 406
-
     new_category = Category(category_name=data['category_name'].lower(),
                             category_description=data['category_description'],
                             user_id=current_user.id)
   
-    new_category.save()
+    try:
+        new_category.save()
+    except IntegrityError as e:
+        db.session.rollback()
+        if violated_constraint(e) != 'category_name':
+            raise
+        return jsonify({
+                            'message': 'Sorry, Category already exists',
+                            'status': False
+                       }), 406
+    response_cache.invalidate(current_user.id)
     return jsonify({'message': 'Succefully added new category', 'status': True, 'category': category}), 201
 
 @mod.route('/category', methods=['GET'])
 @token_required
 @swag_from('docs/category_get_all.yml')
+@response_cache.cached
 def get_categories(current_user):
     """
     Get all user categories.
     """
     if not current_user:
           return jsonify({'message': 'Permision required'}), 403
-    data = []
-    categories = Category.query.filter_by(user_id=current_user.id).all()
-    for cats in categories:
-        cat = {}
-        cat['id'] = cats.id
-        cat['category_name'] = cats.category_name
-        cat['category_description'] = cats.category_description
-        data.append(cat)
 
-    return jsonify({'categories': data}), 200
+    etag = list_etag(Category, current_user.id)
+    return not_modified(etag) or with_etag(list_categories(current_user), etag)
+
+def list_categories(current_user):
+    """
+    Build the get_categories response.
+    """
+    if request.args.get('stream') in ('1', 'true'):
+        return Response(stream_with_context(stream_categories(current_user.id)), mimetype='application/json')
+
+    query = db.session.query(Category.id, Category.category_name, Category.category_description)\
+        .filter(Category.user_id == current_user.id)
+    if 'after' not in request.args and 'limit' not in request.args:
+        data = [category_to_dict(cats) for cats in query.order_by(Category.id)]
+        return jsonify({'categories': data}), 200
+
+    try:
+        limit = min(int(request.args.get('limit', 20)), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'message': 'Ivalid limit parameter'}), 422
+    if limit < 1:
+        return jsonify({'message': 'Ivalid limit parameter'}), 422
+    try:
+        categories, next_cursor = keyset_page(query, [Category.id], 'id', after=request.args.get('after'), limit=limit)
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': False}), 422
+
+    return jsonify({'categories': [category_to_dict(cats) for cats in categories], 'next': next_cursor}), 200
 
 @mod.route('/category/<int:category_id>', methods=['GET'])
 @token_required
@@ -77,12 +123,8 @@ def get_category(current_user, category_id):
     if not category:
         return jsonify({'message': 'Category does not exist', 'status': False}), 404
 
-    cat = {}
-    cat['id'] = category.id
-    cat['category_name'] = category.category_name
-    cat['category_description'] = category.category_description
-
-    return jsonify({'category': cat}), 200
+    etag = row_etag(category)
+    return not_modified(etag) or with_etag((jsonify({'category': category_to_dict(category)}), 200), etag)
 
 
 @mod.route('/category/<category_id>', methods=['PUT'])
@@ -108,16 +150,19 @@ def update_category(current_user, category_id):
     if not my_category:
         return jsonify({'message': 'Category does not exist', 'status': False}), 404
     
-    cat_exists = Category.query.filter(Category.category_name == data['category_name'].lower()).filter(Category.user_id == current_user.id).first()
-    if cat_exists:
+    my_category.category_name = data['category_name'].lower()
+    my_category.category_description = data['category_description']
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if violated_constraint(e) != 'category_name':
+            raise
         return jsonify({
                             'message': 'A category with the same name already exists.',
                             'status': False
                        }), 406
-
-    my_category.category_name = data['category_name'].lower()
-    my_category.category_description = data['category_description']
-    db.session.commit()
+    response_cache.invalidate(current_user.id)
     return jsonify({'message': 'Successfully updated category', 'status': True, 'category': category }), 201
 
 
@@ -136,5 +181,6 @@ def delete_category(current_user, category_id):
 
     db.session.delete(category)
     db.session.commit()
+    response_cache.invalidate(current_user.id)
     return jsonify({'message': 'Category successfully deleted', 'status': True}), 200
 
@@ -0,0 +1,72 @@
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app import db
+from .models import Recipe
+from .ingredients import index_recipe_ingredients
+from .jobs import pool
+
+
+@click.command('backfill-ingredients')
+@click.option('--batch-size', default=500, help='Recipes indexed per commit.')
+@with_appcontext
+def backfill_ingredients(batch_size):
+    """Build the ingredient index for existing recipes."""
+    last_id = 0
+    done = 0
+    while True:
+        recipes = Recipe.query.filter(Recipe.id > last_id).order_by(Recipe.id).limit(batch_size).all()
+        if not recipes:
+            break
+        for recipe in recipes:
+            index_recipe_ingredients(recipe)
+        db.session.commit()
+        last_id = recipes[-1].id
+        done += len(recipes)
+        click.echo('Indexed {} recipes'.format(done))
+
+
+@click.command('jobs-worker')
+@click.option('--threads', default=None, type=int, help='Number of worker threads.')
+@with_appcontext
+def jobs_worker(threads):
+    """Run background jobs until interrupted."""
+    pool.start(threads)
+    click.echo('Started {} job worker threads'.format(len(pool.threads)))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create the tables of a new database and mark it as migrated."""
+    from flask_migrate import stamp
+
+    # the migrations target postgres, embedded SQLite databases start here
+    db.create_all()
+    stamp()
+    click.echo('Created the tables of {}'.format(db.engine.url))
+
+
+@click.command('build-apispec')
+@with_appcontext
+def build_apispec():
+    """Compile the OpenAPI spec to APISPEC_PATH, served until the docs change."""
+    apidocs = current_app.extensions['apidocs']
+    with open(apidocs.spec_path, 'wb') as f:
+        f.write(apidocs.build_spec())
+    click.echo('Wrote {}'.format(apidocs.spec_path))
+
+
+def init_app(app):
+    app.cli.add_command(backfill_ingredients)
+    app.cli.add_command(jobs_worker)
+    app.cli.add_command(init_db)
+    app.cli.add_command(build_apispec)
@@ -0,0 +1,156 @@
+import re
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'application/javascript',
+                'text/plain', 'text/html', 'text/css')
+# Content-Encoding value => ETag suffix of that representation
+SUFFIXES = {'br': '-br', 'gzip': '-gzip'}
+SUFFIXED_ETAG = re.compile(r'-(?:br|gzip)"')
+
+
+def negotiate(accept_encoding):
+    """Pick the best encoding the client accepts: br (when brotli is installed), gzip or None."""
+    accepted = parse_accept_header(accept_encoding or '')
+    if brotli is not None and accepted.quality('br') > 0:
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compressible(headers, config):
+    mimetype = headers.get('Content-Type', '').split(';')[0].strip()
+    return (mimetype in config.get('COMPRESS_MIMETYPES', COMPRESSIBLE)
+            and 'Content-Encoding' not in headers
+            and 'no-transform' not in headers.get('Cache-Control', ''))
+
+
+def compress(body, encoding, config):
+    """Compress a whole body."""
+    if encoding == 'br':
+        return brotli.compress(body, quality=config.get('COMPRESS_BROTLI_QUALITY', 5))
+    compressor = zlib.compressobj(config.get('COMPRESS_LEVEL', 6), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def compress_stream(chunks, encoding, config, flush_size=64 * 1024):
+    """Compress a stream of byte chunks, emitting compressed blocks of roughly flush_size."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config.get('COMPRESS_BROTLI_QUALITY', 5))
+        compress_chunk, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(config.get('COMPRESS_LEVEL', 6), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress_chunk, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    pending = 0
+    for chunk in chunks:
+        data = compress_chunk(chunk)
+        pending += len(chunk)
+        if data:
+            yield data
+        if pending >= flush_size:
+            yield flush()
+            pending = 0
+    yield finish()
+
+
+def mark_encoded(headers, encoding, length=None):
+    """Describe an encoded representation: Content-Encoding, Vary, ETag and Content-Length headers."""
+    headers['Content-Encoding'] = encoding
+    vary = headers.get('Vary')
+    if not vary:
+        headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        headers['Vary'] = vary + ', Accept-Encoding'
+    etag = headers.get('ETag')
+    if etag and etag.endswith('"') and not SUFFIXED_ETAG.search(etag):
+        headers['ETag'] = etag[:-1] + SUFFIXES[encoding] + '"'
+    if length is None:
+        headers.pop('Content-Length', None)
+    else:
+        headers['Content-Length'] = str(length)
+
+
+class Compress(object):
+    """
+    WSGI middleware compressing responses with gzip, or brotli when installed.
+
+    Bodies below COMPRESS_MIN_SIZE bytes stay as they are, streamed responses
+    are compressed as they stream. Responses that already carry a
+    Content-Encoding (e.g precompressed cache hits) pass through untouched.
+
+    Encoded representations get their own ETag (suffixed with -gzip or -br),
+    the suffix is stripped from If-None-Match so the views keep comparing
+    against their own ETags.
+    """
+
+    def __init__(self, app):
+        self.config = app.config
+        self.wsgi_app = app.wsgi_app
+
+    def __call__(self, environ, start_response):
+        if not self.config.get('COMPRESS_ENABLED', True) or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return self.wsgi_app(environ, start_response)
+
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            environ['HTTP_IF_NONE_MATCH'] = SUFFIXED_ETAG.sub('"', if_none_match)
+
+        captured = []
+        body = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return body.append
+
+        app_iter = self.wsgi_app(environ, capture)
+        status, headers, exc_info = captured
+        headers = Headers(headers)
+        code = int(status.split(None, 1)[0])
+
+        if code == 304:
+            etag = headers.get('ETag')
+            if etag and if_none_match and etag[:-1] + SUFFIXES[encoding] + '"' in if_none_match:
+                headers['ETag'] = etag[:-1] + SUFFIXES[encoding] + '"'
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return self.chain(body, app_iter) if body else app_iter
+
+        length = headers.get('Content-Length')
+        if code < 200 or code in (204, 206) or not compressible(headers, self.config) or \
+                (length is not None and int(length) < self.config.get('COMPRESS_MIN_SIZE', 500)):
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return self.chain(body, app_iter) if body else app_iter
+
+        if length is None:
+            mark_encoded(headers, encoding)
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return compress_stream(self.chain(body, app_iter), encoding, self.config)
+
+        data = compress(b''.join(self.chain(body, app_iter)), encoding, self.config)
+        mark_encoded(headers, encoding, len(data))
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return [data]
+
+    @staticmethod
+    def chain(body, app_iter):
+        """Yield what was written through write() then the app iterable, closing it at the end."""
+        try:
+            for chunk in body:
+                yield chunk
+            for chunk in app_iter:
+                if chunk:
+                    yield chunk
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
@@ -0,0 +1,96 @@
+import sqlite3
+import itertools
+from contextlib import contextmanager
+
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import orm
+from sqlalchemy.pool import SingletonThreadPool
+
+from .replicas import RoutingSession, replica_binds
+
+_memory_databases = itertools.count(1)
+
+
+def sqlite_pragmas(config):
+    """The pragmas run on every new SQLite connection."""
+    return ['foreign_keys=ON',
+            'journal_mode={}'.format(config.get('SQLITE_JOURNAL_MODE', 'WAL')),
+            'synchronous={}'.format(config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+            'mmap_size={:d}'.format(config.get('SQLITE_MMAP_SIZE', 268435456))]
+
+
+def sqlite_creator(database, config):
+    """
+    Return a function opening tuned connections to a SQLite database.
+
+    With SQLITE_SHARED_CACHE the connections of every thread share one page
+    cache. In memory databases get a private name so that each application
+    has its own, kept alive for as long as the engine lives.
+    """
+    shared = config.get('SQLITE_SHARED_CACHE', True)
+    if database in (None, '', ':memory:'):
+        uri = 'file:chumvi-{}?mode=memory&cache=shared'.format(next(_memory_databases))
+    else:
+        uri = 'file:{}{}'.format(quote(database), '?cache=shared' if shared else '')
+    timeout = config.get('SQLITE_BUSY_TIMEOUT', 5)
+    pragmas = sqlite_pragmas(config)
+
+    def connect():
+        conn = sqlite3.connect(uri, timeout=timeout, uri=True, check_same_thread=False)
+        for pragma in pragmas:
+            conn.execute('PRAGMA ' + pragma)
+        return conn
+
+    if 'mode=memory' in uri:
+        # the database is dropped with its last connection
+        connect.anchor = connect()
+    return connect
+
+
+class Database(SQLAlchemy):
+    """
+    Flask-SQLAlchemy with an embedded SQLite mode.
+
+    A sqlite:// DATABASE_URL gets one long lived connection per thread
+    (instead of a new connection per checkout) opened with WAL journaling,
+    synchronous=NORMAL, memory mapped reads, a shared cache and a busy timeout.
+
+    SQLALCHEMY_REPLICA_URIS adds read replicas, see RoutingSession.
+    """
+
+    def init_app(self, app):
+        super(Database, self).init_app(app)
+        replicas = app.config.get('SQLALCHEMY_REPLICA_URIS') or ()
+        if replicas:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds.update(zip(replica_binds(app), replicas))
+            app.config['SQLALCHEMY_BINDS'] = binds
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    @contextmanager
+    def replica_reads(self):
+        """Let the reads of the block go to a replica, even in a write request."""
+        session = self.session()
+        previous = session.info.get('replica_reads', False)
+        session.info['replica_reads'] = True
+        try:
+            yield
+        finally:
+            session.info['replica_reads'] = previous
+
+    def apply_driver_hacks(self, app, info, options):
+        super(Database, self).apply_driver_hacks(app, info, options)
+        if info.drivername != 'sqlite':
+            return
+        for option in ('max_overflow', 'pool_timeout', 'pool_recycle', 'connect_args'):
+            options.pop(option, None)
+        options['poolclass'] = SingletonThreadPool
+        options['pool_size'] = app.config.get('SQLITE_POOL_SIZE', 16)
+        options['creator'] = sqlite_creator(info.database, app.config)
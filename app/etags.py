@@ -0,0 +1,41 @@
+import hashlib
+
+from flask import request, make_response
+
+from app import db
+
+
+def row_etag(row):
+    """Strong ETag of a single versioned row."""
+    return '{}-{}-{}'.format(row.__tablename__, row.id, row.version)
+
+
+def list_etag(model, user_id):
+    """
+    Strong ETag of a user's listing of model, derived from one aggregate query.
+
+    Inserts and deletes change the count and every update bumps a row version,
+    so the ETag changes whenever any row of the listing does.
+    """
+    count, latest, versions = db.session.query(
+        db.func.count(model.id), db.func.max(model.updated_at), db.func.sum(model.version))\
+        .filter(model.user_id == user_id).one()
+    key = '{}|{}|{}|{}|{}|{}'.format(model.__tablename__, user_id, count, latest, versions, request.query_string)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def not_modified(etag):
+    """Return a 304 response when the client already has etag, else None."""
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def with_etag(response, etag):
+    """Attach etag to a successful view return value, e.g a (response, status) tuple."""
+    response = make_response(response)
+    if response.status_code == 200:
+        response.set_etag(etag)
+    return response
@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from flask import current_app
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool stays saturated for longer than HASH_QUEUE_TIMEOUT."""
+
+
+class HashingPool(object):
+    """
+    Runs the (deliberately slow) password KDF off the request thread.
+
+    At most HASH_MAX_PENDING hashes are running or queued at a time, so a burst
+    of logins waits here, or gets HashingBusy, instead of starving every worker.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def _setup(self):
+        with self._lock:
+            if self._executor is None:
+                workers = current_app.config.get('HASH_WORKERS', 2)
+                if current_app.config.get('HASH_EXECUTOR', 'thread') == 'process':
+                    self._executor = ProcessPoolExecutor(max_workers=workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=workers)
+                self._slots = threading.BoundedSemaphore(current_app.config.get('HASH_MAX_PENDING', 8))
+
+    def run(self, f, *args):
+        if self._executor is None:
+            self._setup()
+        if not self._slots.acquire(timeout=current_app.config.get('HASH_QUEUE_TIMEOUT', 2)):
+            raise HashingBusy()
+        try:
+            return self._executor.submit(f, *args).result()
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+pool = HashingPool()
+
+
+def hash_password(password):
+    """Hash a password with the configured PASSWORD_HASH_METHOD."""
+    return pool.run(generate_password_hash, password, current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:150000'))
+
+
+def verify_password(pwhash, password):
+    return pool.run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """True when pwhash was made with other KDF parameters than the configured ones."""
+    return pwhash.split('$', 1)[0] != current_app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:150000')
@@ -1,12 +1,63 @@
 import re
+import time
 from functools import wraps
 import jwt
 
-from flask import request, make_response, jsonify
+from flask import current_app, g, request, make_response, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from app import app
+from app import db
+from .cache import ConfiguredLRUCache
 from .models import User, Category, Recipe
+from .replicas import mark_written
+
+principal_cache = ConfiguredLRUCache('PRINCIPAL_CACHE_SIZE', 'PRINCIPAL_CACHE_TTL', ttl=5)
+
+class Principal(object):
+    """Lightweight, session independent copy of the authenticated user."""
+    __slots__ = ('id', 'username', 'email')
+
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+
+def load_principal(token):
+    """
+    Resolve a token to a Principal, hitting the database only on a cache miss.
+    Entries are keyed by the token signature and never outlive the token.
+    Tokens signed with a stale `ver` claim (e.g after a password reset) resolve to None.
+    The cache is per process, so other workers keep accepting a revoked token
+    for at most PRINCIPAL_CACHE_TTL seconds.
+    """
+    data = jwt.decode(token, current_app.secret_key)
+    # read your writes: the database session keeps this user on the primary after a write
+    g.db_user_id = data.get('id')
+    key = token.rsplit('.', 1)[-1]
+    principal = principal_cache.get(key)
+    if principal is not None:
+        g.db_user_id = principal.id
+        return principal
+
+    query = db.session.query(User.id, User.username, User.email, User.token_version)
+    with db.replica_reads():
+        if 'id' in data:
+            user = query.filter(User.id == data['id']).first()
+        else:
+            # tokens issued before user ids were signed only carry the email (and version 0)
+            user = query.filter(User.email == data['email']).first()
+    if not user or user.token_version != data.get('ver', 0):
+        return None
+    g.db_user_id = user.id
+
+    principal = Principal(user.id, user.username, user.email)
+    principal_cache.set(key, principal, ttl=data.get('exp', 0) - time.time())
+    return principal
+
+def invalidate_principal(user_id):
+    """Forget every cached principal of a user, e.g after a password change."""
+    principal_cache.delete_where(lambda principal: principal.id == user_id)
+    mark_written(user_id)
     
 def token_required(f):
     @wraps(f)
@@ -20,9 +71,10 @@ def token_required(f):
             return jsonify({'message': 'Access Token unavailable', "status": False}), 401
 
         try:
-            data = jwt.decode(token, app.secret_key)
-            current_user = User.query.filter_by(email=data['email']).first()
+            current_user = load_principal(token)
         except:
+            current_user = None
+        if current_user is None:
             return jsonify({'message': 'Invalid Token', "status": False}), 401
         return f(current_user, *args, **kwargs)
 
@@ -52,40 +104,28 @@ def special_character(title):
 
     return False
 
-def recipe_exists(title, user_id):
-    """Helper functions to check if a recipe already exists."""
-    recipe = Recipe.query.filter(Recipe.title == title).filter(Recipe.user_id == user_id).first()
-    if recipe:
-        return True
-
-    return False
-
-def category_exists(title):
-    """Helper functions to check if a recipe already exists."""
-    recipe = Category.query.filter_by(category_name=title).first()
-    if recipe:
-        return True
-
-    return False
-
-def email_exists(email):
-    """ 
-    Helper function that checks if a user email already exists in the system.
-    """
-    email = User.query.filter_by(email=email).first()
-    if email:
-        return True
-    return False
-
-def username_exists(username):
-    """Helper functions that checks if a username already exists."""
-    username = User.query.filter_by(username=username).first()
-    if username:
-        return True
-    return False
 def password_match(pwd, cpass):
     """Helper function that checks if passwords match"""
     if pwd != cpass:
         return False
     return True
 
+
+# how each constraint shows up in IntegrityError: the postgres constraint name
+# and the SQLite error message
+CONSTRAINTS = {
+    'users_email': ('users_email_key', 'users.email'),
+    'users_username': ('users_username_key', 'users.username'),
+    'recipe_title': ('uq_recipes_user_id_lower_title',),
+    'category_name': ('uq_categories_user_id_category_name', 'categories.user_id, categories.category_name'),
+    'category_owner': ('fk_recipes_category_owner', 'FOREIGN KEY constraint failed'),
+}
+
+def violated_constraint(error):
+    """Name the constraint (a key of CONSTRAINTS) an IntegrityError was raised for."""
+    diag = getattr(error.orig, 'diag', None)
+    message = getattr(diag, 'constraint_name', None) or str(error.orig)
+    for name, markers in CONSTRAINTS.items():
+        if any(marker in message for marker in markers):
+            return name
+    return None
@@ -0,0 +1,90 @@
+import re
+
+from sqlalchemy.dialects import postgresql
+
+from app import db
+from .models import Ingredient, Recipe, recipe_ingredients
+
+
+def normalize_ingredient(name):
+    """Normalize a single ingredient name, e.g ' Hummus! ' -> 'hummus'. Plurals are kept as they are."""
+    return ' '.join(re.findall('[a-z0-9]+', name.lower()))[:100]
+
+
+def parse_ingredients(text):
+    """Split a free text ingredient list into unique normalized names."""
+    names = []
+    for part in re.split(r'[,;\n]|\band\b', text or ''):
+        name = normalize_ingredient(part)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def insert_missing(table):
+    """INSERT skipping the rows that violate a unique constraint."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return table.insert().prefix_with('OR IGNORE')
+
+
+def intern_ingredients(names):
+    """
+    Return the Ingredient rows for names, creating the missing ones.
+
+    Names are shared by every user, the missing ones are inserted ignoring
+    conflicts and read back, so concurrent requests adding the same new
+    ingredient don't fail on the unique name.
+    """
+    if not names:
+        return []
+    existing = dict((i.name, i) for i in Ingredient.query.filter(Ingredient.name.in_(names)))
+    missing = [name for name in names if name not in existing]
+    if missing:
+        db.session.execute(insert_missing(Ingredient.__table__), [{'name': name} for name in missing])
+        existing.update((i.name, i) for i in Ingredient.query.filter(Ingredient.name.in_(missing)))
+    return [existing[name] for name in names]
+
+
+def index_recipe_ingredients(recipe):
+    """Refresh the ingredient index of a recipe from its ingredients text."""
+    recipe.ingredient_items = intern_ingredients(parse_ingredients(recipe.ingredients))
+
+
+def recipes_with_ingredients(user_id, names, limit=20):
+    """
+    Return [(recipe, matched, total)] for the user's recipes that use any of names,
+    ranked by the share of the recipe's ingredients that are covered.
+    """
+    matched = db.func.count(recipe_ingredients.c.ingredient_id)
+    totals = recipe_ingredients.alias()
+    total = db.session.query(db.func.count(totals.c.ingredient_id))\
+        .filter(totals.c.recipe_id == Recipe.id).correlate(Recipe).as_scalar()
+    coverage = db.cast(matched, db.Float) / total
+
+    return db.session.query(Recipe, matched, total)\
+        .join(recipe_ingredients, recipe_ingredients.c.recipe_id == Recipe.id)\
+        .join(Ingredient, Ingredient.id == recipe_ingredients.c.ingredient_id)\
+        .filter(Recipe.user_id == user_id)\
+        .filter(Ingredient.name.in_(names))\
+        .group_by(Recipe.id)\
+        .order_by(coverage.desc(), matched.desc(), Recipe.id)\
+        .limit(limit).all()
+
+
+def index_ingredients_bulk(recipes):
+    """
+    Index the ingredients of many freshly inserted recipes at once.
+
+    `recipes` is a list of (recipe_id, ingredients text) pairs.
+    """
+    parsed = [(recipe_id, parse_ingredients(text)) for recipe_id, text in recipes]
+    names = sorted(set(name for _, recipe_names in parsed for name in recipe_names))
+    if not names:
+        return
+    ingredients = intern_ingredients(names)
+    db.session.flush()
+    ids = dict((i.name, i.id) for i in ingredients)
+    rows = [{'recipe_id': recipe_id, 'ingredient_id': ids[name]}
+            for recipe_id, recipe_names in parsed for name in recipe_names]
+    db.session.execute(recipe_ingredients.insert(), rows)
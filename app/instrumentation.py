@@ -0,0 +1,82 @@
+import time
+import logging
+from contextlib import contextmanager
+
+from flask import g, current_app, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# statement lists of the active count_queries() blocks
+_counters = []
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.time())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.time() - conn.info['query_start'].pop()
+    for statements in _counters:
+        statements.append(statement)
+    if has_app_context():
+        queries = getattr(g, 'db_queries', None)
+        if queries is not None:
+            queries.append((statement, elapsed))
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # after_cursor_execute does not run for a failed statement, drop its start time here
+    if context.connection is not None and context.statement is not None:
+        starts = context.connection.info.get('query_start')
+        if starts:
+            starts.pop()
+
+
+@contextmanager
+def count_queries():
+    """Collect every statement executed inside the block into the yielded list."""
+    statements = []
+    _counters.append(statements)
+    try:
+        yield statements
+    finally:
+        _counters.remove(statements)
+
+
+def start_query_log():
+    g.db_queries = []
+
+
+def report_queries(response):
+    queries = getattr(g, 'db_queries', None)
+    if queries is None:
+        return response
+    total = sum(elapsed for _, elapsed in queries)
+    if current_app.debug:
+        response.headers['X-DB-Queries'] = str(len(queries))
+        response.headers['X-DB-Time'] = '{:.2f}ms'.format(total * 1000)
+
+    budget = current_app.config.get('QUERY_BUDGET', 10)
+    if len(queries) > budget:
+        logger.warning('%s %s issued %d queries (budget %d, %.2fms)',
+                       request.method, request.path, len(queries), budget, total * 1000)
+
+    repeats = {}
+    for statement, _ in queries:
+        repeats[statement] = repeats.get(statement, 0) + 1
+    threshold = current_app.config.get('QUERY_REPEAT_THRESHOLD', 5)
+    for statement, count in repeats.items():
+        if count >= threshold:
+            logger.warning('%s %s ran the same statement %d times, possible N+1: %s',
+                           request.method, request.path, count, ' '.join(statement.split())[:200])
+    return response
+
+
+def init_app(app):
+    app.before_request(start_query_log)
+    app.after_request(report_queries)
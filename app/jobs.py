@@ -0,0 +1,240 @@
+import json
+import random
+import logging
+import smtplib
+import datetime
+import threading
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from flask import current_app
+
+from app import db
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+
+
+def job(kind):
+    """Register a function as the handler of a job kind."""
+    def decorator(f):
+        handlers[kind] = f
+        return f
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """Persist a job and wake up the in-process workers."""
+    new_job = Job(kind=kind, payload=json.dumps(payload))
+    db.session.add(new_job)
+    db.session.flush()
+    # read before the commit expires it, or the id costs a reload
+    job_id = new_job.id
+    db.session.commit()
+    if current_app.config.get('JOBS_IN_PROCESS', True):
+        pool.start()
+        pool.wake()
+    return job_id
+
+
+def claim_job():
+    """Mark the next due job as running and return it, or None when idle."""
+    while True:
+        now = datetime.datetime.utcnow()
+        query = db.session.query(Job.id).filter(Job.status == 'queued').filter(Job.run_at <= now)\
+            .order_by(Job.run_at, Job.id)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        candidate = query.first()
+        if candidate is None:
+            db.session.rollback()
+            return None
+        # compare and set, so a job is only ever claimed by the worker whose update matched
+        claimed = Job.query.filter(Job.id == candidate.id).filter(Job.status == 'queued')\
+            .update({'status': 'running', 'claimed_at': now, 'attempts': Job.attempts + 1},
+                    synchronize_session=False)
+        db.session.commit()
+        if claimed == 1:
+            return Job.query.get(candidate.id)
+
+
+def requeue_stale():
+    """Return running jobs whose lease ran out, e.g their worker died, to the queue."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=current_app.config.get('JOBS_LEASE', 600))
+    max_attempts = current_app.config.get('JOBS_MAX_ATTEMPTS', 5)
+    count = Job.query.filter(Job.status == 'running')\
+        .filter(db.or_(Job.claimed_at < cutoff, Job.claimed_at.is_(None)))\
+        .update({'status': db.case([(Job.attempts >= max_attempts, 'failed')], else_='queued'),
+                 'last_error': 'Lease expired'}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def run_job(claimed):
+    """Run a claimed job, rescheduling it with exponential backoff on failure."""
+    try:
+        handlers[claimed.kind](**json.loads(claimed.payload))
+    except Exception as e:
+        logger.exception('Job %s (%s) failed', claimed.id, claimed.kind)
+        claimed.last_error = repr(e)
+        if claimed.attempts >= current_app.config.get('JOBS_MAX_ATTEMPTS', 5):
+            claimed.status = 'failed'
+        else:
+            delay = current_app.config.get('JOBS_BACKOFF', 30) * 2 ** (claimed.attempts - 1)
+            claimed.status = 'queued'
+            claimed.run_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay * random.uniform(1, 1.5))
+    else:
+        claimed.status = 'done'
+    db.session.commit()
+
+
+def run_pending():
+    """Run due jobs until the queue is empty, returning how many ran."""
+    requeue_stale()
+    count = 0
+    while True:
+        claimed = claim_job()
+        if claimed is None:
+            return count
+        run_job(claimed)
+        count += 1
+
+
+class WorkerPool(object):
+    """
+    Threads that drain the job queue in the background.
+
+    Threads are only started on first use so that forking servers
+    (gunicorn --preload) start them in each worker, after the fork.
+    """
+
+    def __init__(self):
+        self.threads = []
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.app = None
+
+    def start(self, size=None):
+        with self._lock:
+            if self.threads:
+                return
+            self._stopping = False
+            self.app = current_app._get_current_object()
+            for i in range(size or current_app.config.get('JOBS_WORKERS', 2)):
+                thread = threading.Thread(target=self._work, name='jobs-worker-{}'.format(i))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def wake(self):
+        self._event.set()
+
+    def stop(self):
+        self._stopping = True
+        self._event.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def _work(self):
+        poll = self.app.config.get('JOBS_POLL_INTERVAL', 5)
+        while not self._stopping:
+            # cleared before looking at the queue, so a wake() that comes in meanwhile is kept
+            self._event.clear()
+            try:
+                with self.app.app_context():
+                    ran = run_pending()
+            except Exception:
+                logger.exception('Job worker crashed, retrying')
+                ran = 0
+            if not ran:
+                self._event.wait(poll)
+
+
+pool = WorkerPool()
+
+
+class SMTPPool(object):
+    """Keeps authenticated SMTP connections around so each mail skips the handshake."""
+
+    def __init__(self):
+        self._idle = queue.LifoQueue()
+
+    def connect(self):
+        config = current_app.config
+        if config.get('MAIL_USE_SSL'):
+            conn = smtplib.SMTP_SSL(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30)
+        else:
+            conn = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30)
+            if config.get('MAIL_USE_TLS'):
+                conn.starttls()
+        if config.get('MAIL_USERNAME') and config.get('MAIL_PASSWORD'):
+            conn.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        return conn
+
+    def checkout(self):
+        """Return an idle connection that still answers, or a new one."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self.connect()
+            try:
+                if conn.noop()[0] == 250:
+                    return conn
+            except (smtplib.SMTPException, IOError):
+                pass
+            self._close(conn)
+
+    def checkin(self, conn):
+        if self._idle.qsize() < current_app.config.get('SMTP_POOL_SIZE', 2):
+            self._idle.put(conn)
+        else:
+            self._close(conn)
+
+    def send(self, sender, recipients, message):
+        conn = self.checkout()
+        try:
+            conn.sendmail(sender, recipients, message)
+        except Exception:
+            self._close(conn)
+            raise
+        self.checkin(conn)
+
+    def clear(self):
+        while not self._idle.empty():
+            self._close(self._idle.get_nowait())
+
+    def _close(self, conn):
+        try:
+            conn.quit()
+        except Exception:
+            pass
+
+
+smtp_pool = SMTPPool()
+
+
+@job('send_mail')
+def send_mail(subject, sender, recipients, body):
+    """Deliver a plain text email through the pooled SMTP connections."""
+    try:
+        body.encode('ascii')
+        charset = 'us-ascii'  # sent as is (7bit), like Flask-Mail does
+    except UnicodeEncodeError:
+        charset = 'utf-8'
+    msg = MIMEText(body, 'plain', charset)
+    msg['Subject'] = subject
+    msg['From'] = sender
+    msg['To'] = ', '.join(recipients)
+    msg['Date'] = formatdate(localtime=True)
+    msg['Message-ID'] = make_msgid()
+    smtp_pool.send(sender, recipients, msg.as_string())
@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import errno
+import threading
+
+from flask import g, current_app, request, Response
+
+from app import db
+from .response_cache import response_cache
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry(object):
+    """
+    Request metrics of this process.
+
+    With METRICS_DIR set, every worker dumps its registry to its own file in
+    that directory and /metrics adds up all of them, so one scrape sees the
+    totals of every gunicorn worker. The files of exited workers are folded
+    into ARCHIVE by archive(), see gunicorn.conf.py.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flushed = 0
+        self._timer = None
+        self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.histograms = {}
+        self.in_flight = 0
+
+    def inc_requests(self, labels):
+        with self._lock:
+            self.requests[labels] = self.requests.get(labels, 0) + 1
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            histogram = self.histograms.setdefault((name, labels), [[0] * len(BUCKETS), 0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def track_in_flight(self, delta):
+        with self._lock:
+            self.in_flight += delta
+
+    def snapshot(self):
+        with self._lock:
+            cache = response_cache.stats()
+            return {
+                'pid': os.getpid(),
+                'requests': [[list(k), v] for k, v in self.requests.items()],
+                'histograms': [[name, list(labels), [list(h[0]), h[1], h[2]]]
+                               for (name, labels), h in self.histograms.items()],
+                'in_flight': self.in_flight,
+                'cache': [cache['hits'], cache['misses']],
+            }
+
+    def flush(self, force=False):
+        """
+        Write this process' snapshot to METRICS_DIR, at most once per METRICS_FLUSH_INTERVAL.
+
+        A flush skipped for being too early is made up by a timer at the end of
+        the interval, so the last requests of a burst are written even when the
+        worker goes idle afterwards.
+        """
+        directory = current_app.config.get('METRICS_DIR')
+        if not directory:
+            return
+        wait = self._flushed + current_app.config.get('METRICS_FLUSH_INTERVAL', 1) - time.time()
+        if force or wait <= 0:
+            self.write(directory)
+        else:
+            self.schedule(directory, wait)
+
+    def schedule(self, directory, wait):
+        with self._write_lock:
+            if self._timer is None:
+                self._timer = threading.Timer(wait, self.write, (directory,))
+                self._timer.daemon = True
+                self._timer.start()
+
+    def write(self, directory):
+        with self._write_lock:
+            timer, self._timer = self._timer, None
+            if timer is not None and timer is not threading.current_thread():
+                timer.cancel()
+            self._flushed = time.time()
+            _write_snapshot(os.path.join(directory, 'metrics-{}.json'.format(os.getpid())), self.snapshot())
+
+
+registry = Registry()
+
+# totals of the exited workers
+ARCHIVE = 'archive.json'
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_snapshot(path, snapshot):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot, f)
+    os.rename(path + '.tmp', path)
+
+
+def archive(directory, pid):
+    """
+    Fold the snapshot of the exited worker pid into ARCHIVE and delete its file.
+
+    Called by the gunicorn master when a worker exits, before a new worker can
+    reuse the pid and overwrite the file with smaller counters.
+    """
+    path = os.path.join(directory, 'metrics-{}.json'.format(pid))
+    snapshot = _read_snapshot(path)
+    if snapshot is not None:
+        archived = _read_snapshot(os.path.join(directory, ARCHIVE))
+        merged = merge([s for s in (archived, snapshot) if s is not None])
+        _write_snapshot(os.path.join(directory, ARCHIVE), {
+            'pid': None,
+            'requests': [[list(k), v] for k, v in merged['requests'].items()],
+            'histograms': [[name, list(labels), h] for (name, labels), h in merged['histograms'].items()],
+            'in_flight': 0,
+            'cache': merged['cache'],
+        })
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def collect():
+    """Merge the snapshots of every worker (the live one for this process) and the archive."""
+    snapshots = [registry.snapshot()]
+    directory = current_app.config.get('METRICS_DIR')
+    if directory:
+        for name in os.listdir(directory):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            snapshot = _read_snapshot(os.path.join(directory, name))
+            if snapshot is None or snapshot['pid'] == os.getpid():
+                continue
+            if not _alive(snapshot['pid']):
+                # not archived yet (e.g the master was killed), its counters still count
+                snapshot['in_flight'] = 0
+            snapshots.append(snapshot)
+        archived = _read_snapshot(os.path.join(directory, ARCHIVE))
+        if archived is not None:
+            snapshots.append(archived)
+    return merge(snapshots)
+
+
+def merge(snapshots):
+    """Add up snapshots, keyed by label tuples."""
+    merged = {'requests': {}, 'histograms': {}, 'in_flight': 0, 'cache': [0, 0]}
+    for snapshot in snapshots:
+        for labels, value in snapshot['requests']:
+            key = tuple(labels)
+            merged['requests'][key] = merged['requests'].get(key, 0) + value
+        for name, labels, (buckets, total, count) in snapshot['histograms']:
+            key = (name, tuple(labels))
+            histogram = merged['histograms'].setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+            histogram[0] = [a + b for a, b in zip(histogram[0], buckets)]
+            histogram[1] += total
+            histogram[2] += count
+        merged['in_flight'] += snapshot['in_flight']
+        merged['cache'] = [a + b for a, b in zip(merged['cache'], snapshot['cache'])]
+    return merged
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _labels(names, values):
+    return ','.join('{}="{}"'.format(n, str(v).replace('"', '\\"')) for n, v in zip(names, values))
+
+
+HISTOGRAMS = {
+    'chumvi_http_request_duration_seconds': ('Request latency by endpoint.', ('blueprint', 'endpoint')),
+    'chumvi_db_pool_checkout_seconds': ('Time spent waiting for a database connection.', ()),
+}
+
+
+def render(merged):
+    """Render merged metrics in the Prometheus text exposition format."""
+    lines = ['# HELP chumvi_http_requests_total Requests by endpoint and status code.',
+             '# TYPE chumvi_http_requests_total counter']
+    for labels, value in sorted(merged['requests'].items()):
+        lines.append('chumvi_http_requests_total{%s} %d' % (_labels(('blueprint', 'endpoint', 'method', 'status'), labels), value))
+
+    for name, (help_text, label_names) in sorted(HISTOGRAMS.items()):
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} histogram'.format(name))
+        for (metric, labels), (buckets, total, count) in sorted(merged['histograms'].items()):
+            if metric != name:
+                continue
+            base = _labels(label_names, labels)
+            prefix = base + ',' if base else ''
+            for bound, value in zip(BUCKETS, buckets):
+                lines.append('%s_bucket{%sle="%s"} %d' % (name, prefix, bound, value))
+            lines.append('%s_bucket{%sle="+Inf"} %d' % (name, prefix, count))
+            lines.append('%s_sum{%s} %f' % (name, base, total))
+            lines.append('%s_count{%s} %d' % (name, base, count))
+
+    lines += ['# HELP chumvi_http_requests_in_flight Requests being served.',
+              '# TYPE chumvi_http_requests_in_flight gauge',
+              'chumvi_http_requests_in_flight %d' % merged['in_flight'],
+              '# HELP chumvi_response_cache_requests_total Response cache lookups.',
+              '# TYPE chumvi_response_cache_requests_total counter',
+              'chumvi_response_cache_requests_total{result="hit"} %d' % merged['cache'][0],
+              'chumvi_response_cache_requests_total{result="miss"} %d' % merged['cache'][1]]
+    return '\n'.join(lines) + '\n'
+
+
+_instrumented_pools = set()
+
+
+def instrument_pool(pool):
+    """Time how long checkouts wait for a free connection of pool."""
+    if id(pool) in _instrumented_pools:
+        return
+    _instrumented_pools.add(id(pool))
+    do_get = pool._do_get
+
+    def timed_do_get():
+        start = time.time()
+        try:
+            return do_get()
+        finally:
+            registry.observe('chumvi_db_pool_checkout_seconds', (), time.time() - start)
+    pool._do_get = timed_do_get
+
+
+def start_timer():
+    if request.endpoint == 'metrics':
+        return
+    instrument_pool(db.engine.pool)
+    g.metrics_start = time.time()
+    registry.track_in_flight(1)
+
+
+def record_request(exc):
+    start = getattr(g, 'metrics_start', None)
+    if start is None:
+        return
+    registry.track_in_flight(-1)
+    status = getattr(g, 'metrics_status', 500 if exc else 200)
+    labels = (request.blueprint or '', request.endpoint or 'unknown')
+    registry.inc_requests(labels + (request.method, status))
+    registry.observe('chumvi_http_request_duration_seconds', labels, time.time() - start)
+    registry.flush()
+
+
+def remember_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def metrics():
+    """Prometheus scrape endpoint."""
+    registry.flush(force=True)
+    return Response(render(collect()), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.before_request(start_timer)
+    app.teardown_request(record_request)
+    app.after_request(remember_status)
+    app.add_url_rule('/metrics', 'metrics', metrics)
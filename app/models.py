@@ -1,3 +1,8 @@
+import datetime
+
+from sqlalchemy import event, DDL
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
 from app import db
 
 class User(db.Model):
@@ -8,7 +13,8 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True)
     email = db.Column(db.String(50), unique=True)
-    password = db.Column(db.String(80))
+    password = db.Column(db.String(255))
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __init__(self, username, email, password):
         self.username = username
@@ -30,7 +36,18 @@ class Category(db.Model):
     category_name = db.Column(db.String(80))
     category_description = db.Column(db.String)
     user_id = db.Column(db.Integer)
-    recipes = db.relationship('Recipe', order_by='Recipe.id', cascade="all, delete-orphan")
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow, server_default=db.func.now())
+    recipes = db.relationship('Recipe', order_by='Recipe.id', cascade="all, delete-orphan",
+                              primaryjoin='Category.id == Recipe.category_id', foreign_keys='Recipe.category_id')
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'category_name', name='uq_categories_user_id_category_name'),
+        # target of fk_recipes_category_owner
+        db.UniqueConstraint('id', 'user_id', name='uq_categories_id_user_id'),
+    )
+    __mapper_args__ = {'version_id_col': version}
 
     def __init__(self, category_name, category_description, user_id):
         self.category_name = category_name
@@ -44,6 +61,26 @@ class Category(db.Model):
     def __repr__(self):
         return "Category: {}".format(self.category_name)
 
+class Ingredient(db.Model):
+    """This class represents the interned, normalized ingredient names."""
+
+    __tablename__ = 'ingredients'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Ingredient: {}".format(self.name)
+
+recipe_ingredients = db.Table('recipe_ingredients',
+    db.Column('recipe_id', db.Integer, db.ForeignKey('recipes.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('ingredient_id', db.Integer, db.ForeignKey(Ingredient.id), primary_key=True),
+    db.Index('ix_recipe_ingredients_ingredient_id', 'ingredient_id', 'recipe_id')
+)
+
 class Recipe(db.Model):
     """This class represents the Recipe table."""
 
@@ -53,8 +90,21 @@ class Recipe(db.Model):
     title = db.Column(db.String(200))
     ingredients = db.Column(db.String)
     steps = db.Column(db.String)
-    category_id = db.Column(db.Integer, db.ForeignKey(Category.id))
+    category_id = db.Column(db.Integer)
     user_id = db.Column(db.Integer)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow, server_default=db.func.now())
+    # maintained by the recipes_search_vector_update trigger on postgres
+    search_vector = db.deferred(db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql')))
+    ingredient_items = db.relationship(Ingredient, secondary=recipe_ingredients)
+
+    __table_args__ = (
+        # a recipe may only point at a category of the same user
+        db.ForeignKeyConstraint(['category_id', 'user_id'], ['categories.id', 'categories.user_id'],
+                                name='fk_recipes_category_owner'),
+    )
+    __mapper_args__ = {'version_id_col': version}
 
     def __init__(self, title, ingredients, steps, category_id, user_id):
         self.title = title
@@ -68,4 +118,53 @@ class Recipe(db.Model):
         db.session.commit()
 
     def __repr__(self):
-        return "Recipe: {}".format(self.title)
\ No newline at end of file
+        return "Recipe: {}".format(self.title)
+
+class Job(db.Model):
+    """This class represents the background job queue."""
+
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+    def __init__(self, kind, payload):
+        self.kind = kind
+        self.payload = payload
+
+    def __repr__(self):
+        return "Job {}: {} ({})".format(self.id, self.kind, self.status)
+
+# indexes backing the per user filters in the category and recipe handlers
+db.Index('ix_recipes_user_id_id', Recipe.user_id, Recipe.id)
+db.Index('uq_recipes_user_id_lower_title', Recipe.user_id, db.func.lower(Recipe.title), unique=True)
+db.Index('ix_recipes_category_id', Recipe.category_id)
+
+
+SEARCH_VECTOR_TRIGGER = """
+CREATE OR REPLACE FUNCTION recipes_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.ingredients, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.steps, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_search_vector_update BEFORE INSERT OR UPDATE OF title, ingredients, steps
+    ON recipes FOR EACH ROW EXECUTE PROCEDURE recipes_search_vector_update();
+
+CREATE INDEX ix_recipes_search_vector ON recipes USING gin (search_vector);
+"""
+
+event.listen(Recipe.__table__, 'after_create', DDL(SEARCH_VECTOR_TRIGGER).execute_if(dialect='postgresql'))
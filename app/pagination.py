@@ -0,0 +1,77 @@
+import json
+import base64
+
+from app import db
+
+MAX_LIMIT = 100
+
+
+def encode_cursor(order, values):
+    """Pack the sort key of the last row of a page into an opaque token."""
+    raw = json.dumps({'o': order, 'k': values}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, order, columns):
+    """
+    Unpack a token created by encode_cursor, raising ValueError when invalid.
+
+    The token is client supplied, so the key must hold one value of the python type
+    of each of `columns` before it gets anywhere near a query.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(str(token) + '=' * (-len(token) % 4))
+        data = json.loads(raw.decode('utf-8'))
+        values = list(data['k'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if data.get('o') != order:
+        raise ValueError('Cursor does not match the requested order')
+    if len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    for column, value in zip(columns, values):
+        expected = column.type.python_type
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError('Invalid cursor')
+    return values
+
+
+def keyset_page(query, columns, order, after=None, limit=20):
+    """
+    Return (items, next_cursor) for the page of query following the cursor `after`.
+
+    `columns` are the sort key, most significant first, and must end with a unique column.
+    The next page is found with a WHERE on the sort key instead of OFFSET, so every page
+    costs the same and no COUNT(*) is issued.
+    """
+    if after:
+        values = decode_cursor(after, order, columns)
+        query = query.filter(_after(columns, values))
+    items = query.order_by(*columns).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(order, [getattr(last, c.key) for c in columns])
+    return items, next_cursor
+
+
+def _after(columns, values):
+    """Build `(c1, c2, ...) > (v1, v2, ...)` portably."""
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column > value
+    return db.or_(column > value, db.and_(column == value, _after(columns[1:], values[1:])))
+
+
+def estimate_count(query):
+    """Row estimate of query from the postgres planner statistics, None elsewhere."""
+    bind = db.session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return None
+    compiled = query.statement.compile(dialect=bind.dialect)
+    plan = db.session.connection().execute('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
@@ -3,17 +3,64 @@ from json.decoder import JSONDecodeError
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 
-from flask import Blueprint, request, jsonify, make_response
-from app import app, db, models
+from flask import Blueprint, current_app, request, jsonify, make_response
+from sqlalchemy.exc import IntegrityError
+from app import db, models
 
-from flasgger import swag_from
+from .apidocs import swag_from
 from .serializers import RecipeSchema
-from .helpers import token_required, check_password, check_mail, special_character, recipe_exists, category_exists
+from .helpers import token_required, check_password, check_mail, special_character, violated_constraint
 from .models import User, Category, Recipe
+from .search import search_recipes, invalidate_index
+from .ingredients import index_recipe_ingredients, index_ingredients_bulk, parse_ingredients, recipes_with_ingredients
+from .pagination import keyset_page, estimate_count, MAX_LIMIT
+from .etags import row_etag, list_etag, not_modified, with_etag
+from .response_cache import response_cache
 
 
 mod = Blueprint('recipes', __name__)
 
+RECIPE_FIELDS = ('id', 'title', 'ingredients', 'steps', 'category_id')
+# default of the listings, leaves the long text columns in the database
+SUMMARY_FIELDS = ('id', 'title', 'category_id')
+
+def recipe_to_dict(recipe, fields=RECIPE_FIELDS):
+    """Serialize a recipe row."""
+    recipee = {}
+    for field in fields:
+        recipee[field] = getattr(recipe, field)
+    return recipee
+
+def requested_fields(default):
+    """
+    Recipe fields selected by the `fields` parameter (e.g fields=id,title), or default.
+    fields=all selects every field. Raises ValueError on unknown fields.
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return default
+    if fields == 'all':
+        return RECIPE_FIELDS
+    fields = tuple(field.strip() for field in fields.split(',') if field.strip())
+    unknown = [field for field in fields if field not in RECIPE_FIELDS]
+    if unknown or not fields:
+        raise ValueError('Invalid fields parameter, use any of {}'.format(', '.join(RECIPE_FIELDS)))
+    return fields
+
+def load_fields(query, fields, *extra):
+    """Only fetch the columns of fields (and extra), the others are never loaded."""
+    return query.options(db.load_only(*(fields + extra)))
+
+def recipe_integrity_error(error, category_status):
+    """Translate a failed recipe write into the matching error response."""
+    db.session.rollback()
+    constraint = violated_constraint(error)
+    if constraint == 'recipe_title':
+        return jsonify({'message': 'Recipe with similar name already exists', 'status': False }), 422
+    elif constraint == 'category_owner':
+        return jsonify({'message':'Could not Find a matching category id.', 'status': False}), category_status
+    raise error
+
 @mod.route('/recipe', methods=['POST'])
 @token_required
 @swag_from('docs/recipe_post.yml')
@@ -32,30 +79,117 @@ def add_recipe(current_user):
         return jsonify({'message': 'Could not process the provided keys'}), 422
     if errors:
         return make_response(json.dumps({'errors': errors, 'status': False})), 422
-    elif recipe_exists(data['title'].lower(), current_user.id):
-        return jsonify({'message': 'Recipe with similar name already exists', 'status': False }), 422
 
-    cat_exists = Category.query.filter(Category.id == data['category_id']).filter(Category.user_id == current_user.id).first()
-    if cat_exists:
-        my_recipe = Recipe(
-            title=data['title'].lower(),
-            ingredients=data['ingredients'],
-            steps=data['steps'],
-            category_id=data['category_id'],
-            user_id=current_user.id)
+    # duplicate titles and foreign categories are rejected by the database constraints
+    my_recipe = Recipe(
+        title=data['title'].lower(),
+        ingredients=data['ingredients'],
+        steps=data['steps'],
+        category_id=data['category_id'],
+        user_id=current_user.id)
+    try:
+        index_recipe_ingredients(my_recipe)
         my_recipe.save()
+    except IntegrityError as e:
+        return recipe_integrity_error(e, 403)
+    response_cache.invalidate(current_user.id)
 
-        return jsonify({'message': 'Successfully added new Recipe', 'status': True, 'recipe': recipe}), 201
-    return jsonify({'message':'Could not Find a matching category id.', 'status': False}), 403
+    return jsonify({'message': 'Successfully added new Recipe', 'status': True, 'recipe': recipe}), 201
+
+
+@mod.route('/recipe/batch', methods=['POST'])
+@token_required
+@swag_from('docs/recipe_batch.yml')
+def add_recipes(current_user):
+    """
+    Post many recipes in one transaction.
+    """
+    try:
+        items = json.loads(request.data.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({'message': 'Could not process the provided keys'}), 422
+    if isinstance(items, dict):
+        items = items.get('recipes')
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'Provide a list of recipes', 'status': False}), 422
+    if len(items) > current_app.config.get('RECIPE_BATCH_LIMIT', 5000):
+        return jsonify({'message': 'Too many recipes in one batch', 'status': False}), 413
+
+    recipes, errors = RecipeSchema(many=True).load(items)
+    errors = dict((int(i), e) for i, e in errors.items())
+    # the deserialized values, e.g "1" is already 1
+    valid = [(i, recipe) for i, recipe in enumerate(recipes) if i not in errors]
+
+    titles = set(item['title'].lower() for _, item in valid)
+    category_ids = set(item['category_id'] for _, item in valid)
+    existing = set(t for t, in db.session.query(db.func.lower(Recipe.title))
+                   .filter(Recipe.user_id == current_user.id)
+                   .filter(db.func.lower(Recipe.title).in_(titles))) if titles else set()
+    owned = set(c for c, in db.session.query(Category.id)
+                .filter(Category.user_id == current_user.id)
+                .filter(Category.id.in_(category_ids))) if category_ids else set()
+
+    rows = []
+    for i, item in valid:
+        title = item['title'].lower()
+        if title in existing:
+            errors[i] = {'title': ['Recipe with similar name already exists']}
+        elif item['category_id'] not in owned:
+            errors[i] = {'category_id': ['Could not Find a matching category id.']}
+        else:
+            existing.add(title)
+            rows.append({'title': title, 'ingredients': item['ingredients'], 'steps': item['steps'],
+                         'category_id': item['category_id'], 'user_id': current_user.id})
+
+    if rows:
+        try:
+            db.session.execute(Recipe.__table__.insert(), rows)
+            ids = dict(db.session.query(Recipe.title, Recipe.id)
+                       .filter(Recipe.user_id == current_user.id)
+                       .filter(Recipe.title.in_([row['title'] for row in rows])))
+            index_ingredients_bulk([(ids[row['title']], row['ingredients']) for row in rows])
+            db.session.commit()
+        except IntegrityError:
+            # a concurrent request added one of the titles, deleted one of the categories or
+            # won some other unique key; the batch is all or nothing so report it as a conflict
+            db.session.rollback()
+            return jsonify({'message': 'The recipes conflict with concurrent changes, none were added',
+                            'status': False}), 409
+        invalidate_index(current_user.id)
+        response_cache.invalidate(current_user.id)
+
+    created = [dict(row, id=ids[row['title']]) for row in rows] if rows else []
+    for recipe in created:
+        del recipe['user_id']
+    return jsonify({
+        'message': 'Successfully added {} recipes'.format(len(created)),
+        'status': not errors,
+        'recipes': created,
+        'errors': errors
+    }), 201 if created else 422
 
 
 @mod.route('/recipe', methods=['GET'])
 @token_required
 @swag_from('docs/recipe_get_all.yml')
+@response_cache.cached
 def get_recipes(current_user):
     """
       Get all user's recipes.
     """
+    etag = list_etag(Recipe, current_user.id)
+    return not_modified(etag) or with_etag(list_recipes(current_user), etag)
+
+def list_recipes(current_user):
+    """
+    Build the get_recipes response.
+    """
+    try:
+        fields = requested_fields(SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': False}), 422
+    if 'after' in request.args or 'limit' in request.args:
+        return get_recipes_cursor(current_user, fields)
     try:
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 6))
@@ -64,11 +198,12 @@ def get_recipes(current_user):
     q = str(request.args.get('q','')).lower()
 
     output = []
+    query = load_fields(Recipe.query, fields)
     try:
         if q:
-            recipes = Recipe.query.filter(Recipe.user_id == current_user.id).filter(Recipe.title.ilike('%'+q+'%')).paginate(page = page, per_page = per_page)
+            recipes = query.filter(Recipe.user_id == current_user.id).filter(Recipe.title.ilike('%'+q+'%')).paginate(page = page, per_page = per_page)
         else:
-            recipes = Recipe.query.filter_by(user_id=current_user.id).paginate(page = page, per_page = per_page)
+            recipes = query.filter_by(user_id=current_user.id).paginate(page = page, per_page = per_page)
     except:
         return jsonify({'message': 'The requested URL was not found on the server'}), 404
            
@@ -76,18 +211,91 @@ def get_recipes(current_user):
         return jsonify({'message': 'No recipes available', 'status': False }), 
 
     for recipe in recipes.items: 
-        recipee = {}
-        recipee['id'] = recipe.id
-        recipee['title'] = recipe.title
-        recipee['ingredients'] = recipe.ingredients
-        recipee['steps'] = recipe.steps
-        recipee['category_id'] = recipe.category_id
-        output.append(recipee)
+        output.append(recipe_to_dict(recipe, fields))
             
     
     return jsonify({'recipes': output, 'pages': recipes.pages, 'page': recipes.page})
    
 
+def get_recipes_cursor(current_user, fields=SUMMARY_FIELDS):
+    """
+    Keyset paginated variant of get_recipes, selected by the `after`/`limit` parameters.
+    """
+    order = request.args.get('order', 'id')
+    if order not in ('id', 'title'):
+        return jsonify({'message': 'Invalid order parameter, use id or title'}), 422
+    try:
+        limit = min(int(request.args.get('limit', 6)), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'message': 'Ivalid limit parameter'}), 422
+    if limit < 1:
+        return jsonify({'message': 'Ivalid limit parameter'}), 422
+    q = str(request.args.get('q','')).lower()
+
+    query = Recipe.query.filter(Recipe.user_id == current_user.id)
+    if q:
+        query = query.filter(Recipe.title.ilike('%'+q+'%'))
+    columns = [Recipe.id] if order == 'id' else [Recipe.title, Recipe.id]
+    try:
+        recipes, next_cursor = keyset_page(load_fields(query, fields, order), columns, order,
+                                           after=request.args.get('after'), limit=limit)
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': False}), 422
+
+    output = {'recipes': [recipe_to_dict(recipe, fields) for recipe in recipes], 'next': next_cursor}
+    if request.args.get('count') == 'estimate':
+        output['estimated_total'] = estimate_count(query)
+    return jsonify(output)
+
+
+@mod.route('/recipe/search', methods=['GET'])
+@token_required
+@swag_from('docs/recipe_search.yml')
+def search(current_user):
+    """
+    Ranked full text search over the user's recipes.
+    """
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 6))
+    except:
+        return jsonify({'message': 'Ivalid page, per_page parameter'}), 422
+    q = str(request.args.get('q', '')).strip()
+    if not q:
+        return jsonify({'message': 'Missing search parameter q', 'status': False}), 422
+    if page < 1 or per_page < 1:
+        return jsonify({'message': 'Ivalid page, per_page parameter'}), 422
+
+    recipes = search_recipes(current_user.id, q, page=page, per_page=per_page)
+    return jsonify({'recipes': [recipe_to_dict(recipe) for recipe in recipes], 'page': page, 'q': q})
+
+
+@mod.route('/recipe/cook', methods=['GET'])
+@token_required
+@swag_from('docs/recipe_cook.yml')
+def cook(current_user):
+    """
+    Find recipes that can be cooked with the given ingredients.
+    """
+    names = parse_ingredients(request.args.get('ingredients', ''))
+    if not names:
+        return jsonify({'message': 'Missing ingredients parameter', 'status': False}), 422
+    try:
+        limit = min(int(request.args.get('limit', 20)), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'message': 'Ivalid limit parameter'}), 422
+    if limit < 1:
+        return jsonify({'message': 'Ivalid limit parameter'}), 422
+
+    output = []
+    for recipe, matched, total in recipes_with_ingredients(current_user.id, names, limit=limit):
+        recipee = recipe_to_dict(recipe)
+        recipee['matched'] = matched
+        recipee['coverage'] = round(float(matched) / total, 4)
+        output.append(recipee)
+
+    return jsonify({'recipes': output, 'ingredients': names})
+
 
 @mod.route('/recipe/<recipe_id>', methods=['GET'])
 @token_required
@@ -96,19 +304,19 @@ def get_recipe(current_user, recipe_id):
     """
     Get recipe by id.
     """
-    recipe = Recipe.query.filter(Recipe.user_id == current_user.id).filter(Recipe.id == recipe_id).first()
+    try:
+        fields = requested_fields(RECIPE_FIELDS)
+    except ValueError as e:
+        return jsonify({'message': str(e), 'status': False}), 422
+    recipe = load_fields(Recipe.query, fields, 'version')\
+        .filter(Recipe.user_id == current_user.id).filter(Recipe.id == recipe_id).first()
 
     if not recipe:
         return jsonify({'message': 'Recipe is not available', 'status': False}), 404
 
-    recipee = {}
-    recipee['id'] = recipe.id
-    recipee['title'] = recipe.title
-    recipee['ingredients'] = recipe.ingredients
-    recipee['steps'] = recipe.steps
-    recipee['category_id'] = recipe.category_id
-
-    return jsonify({'recipe': recipee})
+    # the ETag names the selected fields, a projection is a different representation
+    etag = row_etag(recipe) if fields == RECIPE_FIELDS else '{}-{}'.format(row_etag(recipe), '.'.join(fields))
+    return not_modified(etag) or with_etag(jsonify({'recipe': recipe_to_dict(recipe, fields)}), etag)
 
 @mod.route('/recipe/<recipe_id>', methods=['PUT'])
 @token_required
@@ -131,19 +339,18 @@ def update_recipe(current_user, recipe_id):
     my_recipe = Recipe.query.filter(Recipe.user_id == current_user.id).filter(Recipe.id == recipe_id).first()
     if not my_recipe:
         return jsonify({'message': 'Recipe is not available', 'status': False}), 404
-    if recipe_exists(data['title'].lower(), current_user.id):
-        return jsonify({'message': 'Recipe with similar name already exists', 'status': False }), 422
         
-    cat_exists = Category.query.filter(Category.id == data['category_id']).filter(Category.user_id == current_user.id).first()
-    if cat_exists:
-        my_recipe.title = data['title'].lower()
-        my_recipe.ingredients = data['ingredients']
-        my_recipe.steps = data['steps']
-        my_recipe.category_id = data['category_id']
-
+    my_recipe.title = data['title'].lower()
+    my_recipe.ingredients = data['ingredients']
+    my_recipe.steps = data['steps']
+    my_recipe.category_id = data['category_id']
+    try:
+        index_recipe_ingredients(my_recipe)
         db.session.commit()
-        return jsonify({'message': 'Successfully updated recipe', 'status': True, 'recipe': recipe}), 201
-    return jsonify({'message':'Could not Find a matching category id.', 'status': False}), 404
+    except IntegrityError as e:
+        return recipe_integrity_error(e, 404)
+    response_cache.invalidate(current_user.id)
+    return jsonify({'message': 'Successfully updated recipe', 'status': True, 'recipe': recipe}), 201
 
 @mod.route('/recipe/<recipe_id>', methods=['DELETE'])
 @token_required
@@ -161,4 +368,5 @@ def delete_recipe(current_user, recipe_id):
 
     db.session.delete(recipe)
     db.session.commit()
+    response_cache.invalidate(current_user.id)
     return jsonify({'message': 'Recipe deleted successfully', 'status': True}), 201
@@ -0,0 +1,77 @@
+import time
+import itertools
+
+from flask import g, current_app, has_app_context, has_request_context, request
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event
+
+from .response_cache import response_cache
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_round_robin = itertools.count()
+
+
+def replica_binds(app):
+    """Bind names of the SQLALCHEMY_REPLICA_URIS of app."""
+    return ['replica_{}'.format(i) for i in range(len(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()))]
+
+
+def choose_replica(db, app):
+    """Pick a replica engine, round robin or the one with the fewest checked out connections."""
+    engines = [db.get_engine(app, bind) for bind in replica_binds(app)]
+    if app.config.get('SQLALCHEMY_REPLICA_SELECTION', 'round-robin') == 'least-loaded':
+        return min(engines, key=lambda engine: getattr(engine.pool, 'checkedout', lambda: 0)())
+    return engines[next(_round_robin) % len(engines)]
+
+
+def mark_written(user_id):
+    """Keep the reads of user_id on the primary for REPLICA_STICKY_SECONDS (read your writes)."""
+    if user_id is None or not has_app_context() or not current_app.config.get('SQLALCHEMY_REPLICA_URIS'):
+        return
+    ttl = current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+    response_cache.backend.set('sticky:{}'.format(user_id), time.time() + ttl, ttl)
+
+
+def is_sticky(user_id):
+    until = response_cache.backend.get('sticky:{}'.format(user_id))
+    return until is not None and until > time.time()
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending reads to the SQLALCHEMY_REPLICA_URIS replicas.
+
+    Flushes always go to the primary. Reads go to one replica per session
+    (so per request) in safe (GET) requests or inside db.replica_reads().
+    The user of the request is set as g.db_user_id when the token is decoded.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and replica_binds(self.app) and self.reads_from_replica():
+            if 'replica' not in self.info:
+                self.info['replica'] = choose_replica(self.db, self.app)
+            return self.info['replica']
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def reads_from_replica(self):
+        """Reads of safe requests (or db.replica_reads() blocks) go to a replica, unless the user wrote recently."""
+        if not has_request_context():
+            return False
+        if request.method not in SAFE_METHODS and not self.info.get('replica_reads'):
+            return False
+        if 'sticky' not in self.info:
+            user_id = g.get('db_user_id')
+            self.info['sticky'] = user_id is not None and is_sticky(user_id)
+        return not self.info['sticky']
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(session):
+    # core inserts (batch, import) never flush, so any committed write request counts
+    if has_request_context() and request.method not in SAFE_METHODS:
+        mark_written(g.get('db_user_id'))
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import errno
+import base64
+import hashlib
+import sqlite3
+import threading
+from functools import wraps
+
+from flask import current_app, request, make_response
+
+from .cache import LRUCache
+from .compression import negotiate, compressible, compress, mark_encoded
+
+
+class MemoryBackend(object):
+    """
+    Per process LRU backend, for a single worker: other workers never see its invalidations.
+
+    Counters live outside the LRU, they must neither expire nor be evicted,
+    or a restarted generation would match entries cached under the old one.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if key in self._counters:
+            return self._counters[key]
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl=ttl)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, 0) + 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._counters.clear()
+
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return {'b64': base64.b64encode(value).decode('ascii')}
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+def _decode_bytes(obj):
+    if list(obj) == ['b64']:
+        return base64.b64decode(obj['b64'])
+    return obj
+
+
+def dumps(value):
+    """JSON encode a cached value, bytes (bodies) as {"b64": ...}. Tuples come back as lists."""
+    return json.dumps(value, default=_encode_bytes, separators=(',', ':'))
+
+
+def loads(data):
+    return json.loads(data, object_hook=_decode_bytes)
+
+
+def create_private_file(path):
+    """Create path readable by this user only, refusing a file someone else planted."""
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, 0o700)
+    try:
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+        if os.stat(path).st_uid != os.geteuid():
+            raise RuntimeError('{} belongs to another user'.format(path))
+
+
+class SQLiteBackend(object):
+    """
+    Backend stored in a local SQLite file, shared by every worker process of the host.
+
+    Values are stored as JSON, never pickled, and keys are prefixed with
+    `namespace` so that apps of different databases can share the file.
+    """
+
+    def __init__(self, path, ttl, namespace=''):
+        self.path = path
+        self.ttl = ttl
+        self.prefix = namespace + ':' if namespace else ''
+        self._local = threading.local()
+
+    def _connection(self):
+        # one connection per thread and per process, never shared across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute('SELECT value, expires FROM cache WHERE key = ?',
+                                         (self.prefix + key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return loads(row[0])
+
+    def set(self, key, value, ttl):
+        self._connection().execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                   (self.prefix + key, dumps(value), time.time() + min(ttl, self.ttl)))
+
+    def incr(self, key):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            value = (self.get(key) or 0) + 1
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                         (self.prefix + key, dumps(value), float('inf')))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        # purge expired entries now and then
+        if value % 100 == 0:
+            conn.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        return value
+
+    def clear(self):
+        """Drop the entries and counters of this namespace."""
+        self._connection().execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(self.prefix), self.prefix))
+
+
+class ResponseCache(object):
+    """
+    Caches GET responses per user.
+
+    Keys embed a per user generation number, so bumping the generation on
+    every write invalidates all of the user's cached responses in O(1).
+
+    Each app gets its own backend (in app.extensions), created on first use.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return self.backend_for(current_app._get_current_object())
+
+    def backend_for(self, app):
+        backend = app.extensions.get('response_cache')
+        if backend is None:
+            with self._lock:
+                backend = app.extensions.get('response_cache')
+                if backend is None:
+                    backend = app.extensions['response_cache'] = self.create_backend(app)
+        return backend
+
+    def create_backend(self, app):
+        ttl = app.config.get('RESPONSE_CACHE_TTL', 300)
+        if app.config.get('RESPONSE_CACHE_BACKEND', 'sqlite') == 'sqlite':
+            path = app.config.get('RESPONSE_CACHE_PATH') or os.path.join(app.instance_path, 'response-cache.sqlite')
+            if path != ':memory:':
+                create_private_file(path)
+            # hashed, the URI may hold a password
+            uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+            return SQLiteBackend(path, ttl, hashlib.sha1(uri.encode('utf-8')).hexdigest()[:16])
+        return MemoryBackend(app.config.get('RESPONSE_CACHE_SIZE', 2048), ttl)
+
+    def key(self, user_id):
+        generation = self.backend.get('gen:{}'.format(user_id)) or 0
+        args = '&'.join('{}={}'.format(k, v) for k, v in sorted(request.args.items(multi=True)))
+        # entries are (body, status, headers, {encoding: compressed body})
+        return 'resp2:{}:{}:{}:{}'.format(user_id, generation, request.endpoint, args)
+
+    def invalidate(self, user_id):
+        """Drop every cached response of a user."""
+        self.backend.incr('gen:{}'.format(user_id))
+
+    def clear(self, app=None):
+        """Drop every entry of app (the current app by default), forget its backend and reset the counters."""
+        app = app or current_app._get_current_object()
+        self.backend_for(app).clear()
+        app.extensions.pop('response_cache', None)
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def cached(self, f):
+        """Cache a view taking the current user as its first argument."""
+        @wraps(f)
+        def decorated(current_user, *args, **kwargs):
+            if not current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+                return f(current_user, *args, **kwargs)
+            key = self.key(current_user.id)
+            entry = self.backend.get(key)
+            if entry is not None:
+                self.hits += 1
+                return self.build(key, entry, 'HIT')
+
+            self.misses += 1
+            response = make_response(f(current_user, *args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            entry = (response.get_data(), response.status_code, list(response.headers.items()), {})
+            self.backend.set(key, entry, current_app.config.get('RESPONSE_CACHE_TTL', 300))
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return decorated
+
+    def build(self, key, entry, state):
+        body, status, headers, encodings = entry
+        response = make_response(body, status, [tuple(header) for header in headers])
+        response.headers['X-Cache'] = state
+        etag = response.get_etag()[0]
+        if etag and etag in request.if_none_match:
+            response = make_response('', 304)
+            response.set_etag(etag)
+            return response
+
+        # hand out the compressed bytes of an earlier hit instead of compressing again
+        config = current_app.config
+        encoding = negotiate(request.headers.get('Accept-Encoding')) if config.get('COMPRESS_ENABLED', True) else None
+        if encoding and len(body) >= config.get('COMPRESS_MIN_SIZE', 500) and compressible(response.headers, config):
+            data = encodings.get(encoding)
+            if data is None:
+                data = encodings[encoding] = compress(body, encoding, config)
+                self.backend.set(key, entry, config.get('RESPONSE_CACHE_TTL', 300))
+            response.set_data(data)
+            mark_encoded(response.headers, encoding, len(data))
+        return response
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,167 @@
+import re
+import math
+import datetime
+import threading
+
+from app import db
+from .cache import ConfiguredLRUCache
+from .models import Recipe
+
+# relative weight of a term depending on the field it was found in,
+# mirrors the A/B/C weights of the postgres search_vector trigger
+FIELD_WEIGHTS = (('title', 1.0), ('ingredients', 0.4), ('steps', 0.2))
+STOPWORDS = frozenset(['a', 'an', 'and', 'the', 'of', 'in', 'on', 'with', 'to', 'for', 'or'])
+
+
+def tokenize(text):
+    """Split text into lowercase search terms."""
+    return [t for t in re.findall('[a-z0-9]+', (text or '').lower()) if t not in STOPWORDS]
+
+
+class InvertedIndex(object):
+    """
+    In memory inverted index over one user's recipes.
+
+    Used for ranked search when the database has no full text support (SQLite).
+    `stamp` is the recipes_stamp of the recipes the index holds, `version_sum`
+    the sum of their versions, to check a refreshed index against the stamp.
+    """
+
+    def __init__(self, stamp=None):
+        self.stamp = stamp
+        self.postings = {}
+        self.documents = {}
+        self.versions = {}
+        self.version_sum = 0
+        self._lock = threading.Lock()
+
+    def add(self, recipe_id, title, ingredients, steps, version=1):
+        weights = {}
+        for field, text in zip(FIELD_WEIGHTS, (title, ingredients, steps)):
+            for term in tokenize(text):
+                weights[term] = weights.get(term, 0) + field[1]
+        with self._lock:
+            self._remove(recipe_id)
+            self.documents[recipe_id] = weights
+            self.versions[recipe_id] = version
+            self.version_sum += version
+            for term, weight in weights.items():
+                self.postings.setdefault(term, {})[recipe_id] = weight
+
+    def remove(self, recipe_id):
+        with self._lock:
+            self._remove(recipe_id)
+
+    def _remove(self, recipe_id):
+        self.version_sum -= self.versions.pop(recipe_id, 0)
+        for term in self.documents.pop(recipe_id, {}):
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(recipe_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, q):
+        """Return [(recipe_id, score)] matching every term of q, best first."""
+        terms = set(tokenize(q))
+        if not terms:
+            return []
+        with self._lock:
+            postings = sorted((self.postings.get(t, {}) for t in terms), key=len)
+            if not postings[0]:
+                return []
+            total = len(self.documents)
+            matches = set(postings[0])
+            for posting in postings[1:]:
+                matches.intersection_update(posting)
+            scores = {}
+            for posting in postings:
+                idf = math.log(1 + total / float(len(posting)))
+                for recipe_id in matches:
+                    scores[recipe_id] = scores.get(recipe_id, 0) + posting[recipe_id] * idf
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+# how far apart the clocks of the workers setting updated_at may be
+UPDATED_AT_SKEW = datetime.timedelta(seconds=5)
+
+indexes = ConfiguredLRUCache('SEARCH_INDEX_USERS', maxsize=256, ttl=float('inf'))
+
+
+def recipes_stamp(user_id):
+    """
+    Count, latest update and version sum of a user's recipes. Inserts and
+    deletes change the count and every update bumps a version, whichever
+    process (or worker) made them.
+    """
+    return tuple(db.session.query(
+        db.func.count(Recipe.id), db.func.max(Recipe.updated_at), db.func.sum(Recipe.version))
+        .filter(Recipe.user_id == user_id).one())
+
+
+def recipe_rows(user_id):
+    return db.session.query(Recipe.id, Recipe.title, Recipe.ingredients, Recipe.steps, Recipe.version)\
+        .filter(Recipe.user_id == user_id)
+
+
+def get_index(user_id):
+    """Return the inverted index of a user, brought up to date when the user's recipes changed."""
+    stamp = recipes_stamp(user_id)
+    index = indexes.get(user_id)
+    if index is not None and index.stamp != stamp and not refresh_index(index, user_id, stamp):
+        index = None
+    if index is None:
+        index = InvertedIndex(stamp)
+        for row in recipe_rows(user_id).yield_per(500):
+            index.add(*row)
+        indexes.set(user_id, index)
+    return index
+
+
+def refresh_index(index, user_id, stamp):
+    """
+    Re-read only the recipes updated since the index was stamped (give or
+    take UPDATED_AT_SKEW of clock differences between workers) and drop the
+    deleted ones. Returns False when the result still disagrees with stamp,
+    e.g after an update that did not touch updated_at, and a rebuild is due.
+    """
+    count, latest, versions = stamp
+    since = index.stamp[1]
+    if since is None:
+        return False
+    for row in recipe_rows(user_id).filter(Recipe.updated_at >= since - UPDATED_AT_SKEW):
+        index.add(*row)
+    if len(index.documents) != count:
+        ids = set(recipe_id for recipe_id, in db.session.query(Recipe.id).filter(Recipe.user_id == user_id))
+        for recipe_id in set(index.documents) - ids:
+            index.remove(recipe_id)
+    if len(index.documents) != count or index.version_sum != (versions or 0):
+        return False
+    index.stamp = stamp
+    return True
+
+
+def invalidate_index(user_id):
+    """Free a user's index early, e.g after bulk inserts. Stale indexes are rebuilt anyway."""
+    indexes.delete(user_id)
+
+
+def has_fulltext():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def search_recipes(user_id, q, page=1, per_page=6):
+    """Return one page of the user's recipes matching q ordered by relevance."""
+    offset = (page - 1) * per_page
+    if has_fulltext():
+        query = db.func.plainto_tsquery('english', q)
+        return Recipe.query.filter(Recipe.user_id == user_id)\
+            .filter(Recipe.search_vector.op('@@')(query))\
+            .order_by(db.func.ts_rank_cd(Recipe.search_vector, query).desc(), Recipe.id)\
+            .offset(offset).limit(per_page).all()
+
+    ids = [recipe_id for recipe_id, _ in get_index(user_id).search(q)[offset:offset + per_page]]
+    if not ids:
+        return []
+    recipes = dict((r.id, r) for r in Recipe.query.filter(Recipe.id.in_(ids)))
+    return [recipes[i] for i in ids if i in recipes]
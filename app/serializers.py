@@ -1,11 +1,13 @@
 import json
 from marshmallow import Schema, post_load, pre_load, validates, fields, ValidationError
 from .models import User, Category, Recipe
-from .helpers import special_character, email_exists, username_exists, check_password, check_mail
+from .helpers import special_character, check_password, check_mail
 
 class UserSchema(Schema):
     """
     Validates Registration.
+
+    Uniqueness of username and email is enforced by the users table constraints.
     """
     username = fields.String(required=True,
     error_messages={'required': 'Username must be at least 3 characters'})
@@ -18,13 +20,6 @@ class UserSchema(Schema):
             raise ValidationError('Username should not contain Special characters')
         if len(username) <= 3:
             raise ValidationError('Username should be atleast 4 characters long')
-        elif username_exists(username):
-            raise ValidationError('A user with username "%s" already exists' % username)
-
-    @validates('email')
-    def validate_user_exists(self, email):
-        if email_exists(email):
-            raise ValidationError('A user with email "%s" already exists' % email)
 
     @validates('password')
     def validate_user_password(self, password):
@@ -38,9 +33,7 @@ class LoginSchema(Schema):
 
     @validates('email')
     def validate_email(self, email):
-        if not email_exists(email):
-            raise ValidationError('User does not exists.')
-        elif not check_mail(email):
+        if not check_mail(email):
             raise ValidationError('Please provide a valid email address')
 
 class CategorySchema(Schema):
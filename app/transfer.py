@@ -0,0 +1,234 @@
+import gzip
+import json
+import zlib
+
+from flask import Blueprint, current_app, request, jsonify, Response, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from .apidocs import swag_from
+from app import db
+
+from .helpers import token_required
+from .models import Category, Recipe
+from .serializers import CategorySchema, RecipeSchema
+from .ingredients import index_ingredients_bulk
+from .search import invalidate_index
+from .response_cache import response_cache
+from .compression import compress_stream
+
+
+mod = Blueprint('transfer', __name__)
+
+# rows fetched from the server side cursor at a time
+EXPORT_WINDOW = 500
+
+
+def export_lines(user_id):
+    """Yield the user's categories then recipes as NDJSON lines."""
+    categories = db.session.query(Category.id, Category.category_name, Category.category_description)\
+        .filter(Category.user_id == user_id).order_by(Category.id).yield_per(EXPORT_WINDOW)
+    for row in categories:
+        yield json.dumps({'type': 'category', 'id': row.id, 'category_name': row.category_name,
+                          'category_description': row.category_description}) + '\n'
+
+    recipes = db.session.query(Recipe.id, Recipe.title, Recipe.ingredients, Recipe.steps, Recipe.category_id)\
+        .filter(Recipe.user_id == user_id).order_by(Recipe.id).yield_per(EXPORT_WINDOW)
+    for row in recipes:
+        yield json.dumps({'type': 'recipe', 'id': row.id, 'title': row.title, 'ingredients': row.ingredients,
+                          'steps': row.steps, 'category_id': row.category_id}) + '\n'
+
+
+def gzip_stream(chunks, flush_size=64 * 1024):
+    """Gzip a stream of text chunks, emitting compressed blocks of roughly flush_size."""
+    return compress_stream((chunk.encode('utf-8') for chunk in chunks), 'gzip', current_app.config, flush_size)
+
+
+@mod.route('/export', methods=['GET'])
+@token_required
+@swag_from('docs/export.yml')
+def export(current_user):
+    """
+    Export all of the user's categories and recipes as NDJSON.
+    """
+    lines = export_lines(current_user.id)
+    headers = {'Content-Disposition': 'attachment; filename=chumvi-export.ndjson'}
+    if request.args.get('gzip') in ('1', 'true'):
+        headers['Content-Encoding'] = 'gzip'
+        lines = gzip_stream(lines)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson', headers=headers)
+
+
+class Importer(object):
+    """
+    Inserts NDJSON categories and recipes for one user in fixed size batches.
+
+    Exported category ids are remapped to the ids of the inserted (or already
+    existing, same named) categories so recipes keep pointing at them. Each batch
+    is its own transaction; a batch that conflicts with a concurrent write is
+    rolled back and its lines are reported as skipped.
+    """
+    MAX_ERRORS = 100
+
+    def __init__(self, user_id, batch_size):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.categories = []
+        self.recipes = []
+        self.category_ids = {}
+        self.summary = {'categories': {'inserted': 0, 'skipped': 0},
+                        'recipes': {'inserted': 0, 'skipped': 0},
+                        'errors': []}
+
+    def error(self, line_no, errors):
+        if len(self.summary['errors']) < self.MAX_ERRORS:
+            self.summary['errors'].append({'line': line_no, 'errors': errors})
+
+    def conflict(self, kind, line_nos):
+        """Account for a batch rolled back because of an IntegrityError."""
+        db.session.rollback()
+        self.summary[kind]['skipped'] += len(line_nos)
+        for line_no in line_nos:
+            self.error(line_no, 'Conflicts with a concurrent change, the batch was rolled back')
+
+    def feed(self, line_no, line):
+        try:
+            item = json.loads(line.decode('utf-8'))
+            kind = item.pop('type')
+        except (ValueError, KeyError, AttributeError, TypeError):
+            return self.error(line_no, 'Invalid line')
+        if kind == 'category':
+            self.categories.append((line_no, item))
+            if len(self.categories) >= self.batch_size:
+                self.flush_categories()
+        elif kind == 'recipe':
+            self.recipes.append((line_no, item))
+            if len(self.recipes) >= self.batch_size:
+                self.flush_recipes()
+        else:
+            self.error(line_no, 'Unknown type {}'.format(kind))
+
+    def flush_categories(self):
+        batch, self.categories = self.categories, []
+        data, errors = CategorySchema(many=True).load([item for _, item in batch])
+        names = set(item['category_name'].lower() for i, item in enumerate(data) if i not in errors)
+        existing = dict(db.session.query(Category.category_name, Category.id)
+                        .filter(Category.user_id == self.user_id)
+                        .filter(Category.category_name.in_(names))) if names else {}
+
+        rows, line_nos, exported_ids = [], [], {}
+        for i, (line_no, item) in enumerate(batch):
+            if i in errors:
+                self.summary['categories']['skipped'] += 1
+                self.error(line_no, errors[i])
+                continue
+            name = item['category_name'].lower()
+            exported_ids.setdefault(name, []).append(item.get('id'))
+            if name in existing:
+                self.summary['categories']['skipped'] += 1
+                continue
+            existing[name] = None
+            line_nos.append(line_no)
+            rows.append({'category_name': name, 'category_description': item['category_description'],
+                         'user_id': self.user_id})
+
+        if rows:
+            try:
+                db.session.execute(Category.__table__.insert(), rows)
+                existing.update(db.session.query(Category.category_name, Category.id)
+                                .filter(Category.user_id == self.user_id)
+                                .filter(Category.category_name.in_([row['category_name'] for row in rows])))
+                db.session.commit()
+            except IntegrityError:
+                # recipes of the batch's categories are then skipped as not matching a category
+                return self.conflict('categories', line_nos)
+            self.summary['categories']['inserted'] += len(rows)
+        for name, ids in exported_ids.items():
+            for exported_id in ids:
+                if exported_id is not None:
+                    self.category_ids[exported_id] = existing[name]
+
+    def flush_recipes(self):
+        if self.categories:
+            self.flush_categories()
+        batch, self.recipes = self.recipes, []
+        for _, item in batch:
+            item.pop('id', None)
+            if item.get('category_id') in self.category_ids:
+                item['category_id'] = self.category_ids[item['category_id']]
+        data, errors = RecipeSchema(many=True).load([item for _, item in batch])
+        valid = [(i, item) for i, item in enumerate(data) if i not in errors]
+
+        titles = set(item['title'].lower() for _, item in valid)
+        category_ids = set(item['category_id'] for _, item in valid)
+        existing = set(t for t, in db.session.query(Recipe.title)
+                       .filter(Recipe.user_id == self.user_id)
+                       .filter(Recipe.title.in_(titles))) if titles else set()
+        owned = set(c for c, in db.session.query(Category.id)
+                    .filter(Category.user_id == self.user_id)
+                    .filter(Category.id.in_(category_ids))) if category_ids else set()
+
+        rows, line_nos = [], []
+        for i, (line_no, item) in enumerate(batch):
+            if i in errors:
+                self.summary['recipes']['skipped'] += 1
+                self.error(line_no, errors[i])
+                continue
+            title = item['title'].lower()
+            if title in existing:
+                self.summary['recipes']['skipped'] += 1
+                continue
+            if item['category_id'] not in owned:
+                self.summary['recipes']['skipped'] += 1
+                self.error(line_no, {'category_id': ['Could not Find a matching category id.']})
+                continue
+            existing.add(title)
+            line_nos.append(line_no)
+            rows.append({'title': title, 'ingredients': item['ingredients'], 'steps': item['steps'],
+                         'category_id': item['category_id'], 'user_id': self.user_id})
+
+        if rows:
+            try:
+                db.session.execute(Recipe.__table__.insert(), rows)
+                ids = dict(db.session.query(Recipe.title, Recipe.id)
+                           .filter(Recipe.user_id == self.user_id)
+                           .filter(Recipe.title.in_([row['title'] for row in rows])))
+                index_ingredients_bulk([(ids[row['title']], row['ingredients']) for row in rows])
+                db.session.commit()
+            except IntegrityError:
+                return self.conflict('recipes', line_nos)
+            self.summary['recipes']['inserted'] += len(rows)
+
+    def finish(self):
+        if self.categories:
+            self.flush_categories()
+        if self.recipes:
+            self.flush_recipes()
+        invalidate_index(self.user_id)
+        response_cache.invalidate(self.user_id)
+        return self.summary
+
+
+@mod.route('/import', methods=['POST'])
+@token_required
+@swag_from('docs/import.yml')
+def import_data(current_user):
+    """
+    Import categories and recipes from an NDJSON body, e.g one produced by /export.
+    """
+    stream = request.stream
+    if request.headers.get('Content-Encoding') == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+
+    importer = Importer(current_user.id, current_app.config.get('IMPORT_BATCH_SIZE', 500))
+    try:
+        for line_no, line in enumerate(stream, 1):
+            if line.strip():
+                importer.feed(line_no, line)
+        summary = importer.finish()
+    except (IOError, EOFError, zlib.error):
+        db.session.rollback()
+        invalidate_index(current_user.id)
+        response_cache.invalidate(current_user.id)
+        return jsonify({'message': 'Could not read the uploaded data', 'status': False,
+                        'summary': importer.summary}), 422
+
+    return jsonify({'message': 'Import complete', 'status': True, 'summary': summary}), 201
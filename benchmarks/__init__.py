@@ -0,0 +1 @@
+"""Benchmarks for the chumvi API, see README.md."""
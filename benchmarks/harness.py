@@ -0,0 +1,69 @@
+import gc
+import json
+import time
+
+
+def bench(name, fn, min_time=0.5, min_runs=20):
+    """Call fn repeatedly for at least min_time seconds and summarise the timings."""
+    fn()  # warm up
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        deadline = time.perf_counter() + min_time
+        while len(timings) < min_runs or time.perf_counter() < deadline:
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    timings.sort()
+    return {
+        'name': name,
+        'runs': len(timings),
+        'ops_per_sec': len(timings) / sum(timings),
+        'p50_us': percentile(timings, 50) * 1e6,
+        'p99_us': percentile(timings, 99) * 1e6,
+    }
+
+
+def percentile(sorted_values, p):
+    index = int(round((len(sorted_values) - 1) * p / 100.0))
+    return sorted_values[index]
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return dict((r['name'], r) for r in json.load(f))
+    except (IOError, ValueError):
+        return {}
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def report(results, baseline=None, tolerance=0.1):
+    """
+    Print a results table, comparing p50 against the baseline when given.
+
+    Returns the names of the benchmarks whose p50 got more than tolerance slower.
+    """
+    baseline = baseline or {}
+    regressions = []
+    print('{:<45} {:>12} {:>11} {:>11} {:>9}'.format('benchmark', 'ops/sec', 'p50 (us)', 'p99 (us)', 'vs base'))
+    for result in results:
+        change = ''
+        base = baseline.get(result['name'])
+        if base:
+            ratio = result['p50_us'] / base['p50_us'] - 1
+            change = '{:+.1%}'.format(ratio)
+            if ratio > tolerance:
+                regressions.append(result['name'])
+                change += ' !'
+        print('{:<45} {:>12,.0f} {:>11.1f} {:>11.1f} {:>9}'.format(
+            result['name'], result['ops_per_sec'], result['p50_us'], result['p99_us'], change))
+    return regressions
@@ -0,0 +1,138 @@
+"""
+Micro benchmarks of the request pipeline building blocks.
+
+    python -m benchmarks.micro                  # run and compare with benchmarks/baseline.json
+    python -m benchmarks.micro --save           # run and store the results as the new baseline
+    python -m benchmarks.micro -k schema        # only benchmarks whose name contains "schema"
+
+Full request round trips run against BENCH_DATABASE_URL (an in-memory
+SQLite database by default). Never point it at a database you care about,
+the tables are created and dropped.
+"""
+import os
+import sys
+import json
+import argparse
+import datetime
+
+import jwt
+
+from .harness import bench, load_baseline, save_baseline, report
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+class Row(object):
+    """Stand-in for a Recipe row."""
+    def __init__(self, i):
+        self.id = i
+        self.title = 'maindi choma {}'.format(i)
+        self.ingredients = 'Maize, lemon, chilli powder, salt ' * 4
+        self.steps = 'Roast the maize over charcoal, rub with lemon and chilli. ' * 6
+        self.category_id = 1
+
+
+def unit_cases(app):
+    from app.helpers import check_mail, check_password, special_character
+    from app.serializers import RecipeSchema, CategorySchema, UserSchema, LoginSchema
+    from app.recipes import recipe_to_dict
+
+    token = jwt.encode({'id': 1, 'ver': 0, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                       app.secret_key)
+    recipe = json.dumps({'title': 'Maindi Choma', 'ingredients': 'Maize, lemon', 'steps': 'Roast the maize', 'category_id': 1})
+    category = json.dumps({'category_name': 'Breakfast', 'category_description': 'Awesome Breakfast'})
+    user = json.dumps({'username': 'testuser', 'email': 'test@example.com', 'password': 'Osupportit.0'})
+    login = json.dumps({'email': 'test@example.com', 'password': 'Osupportit.0'})
+    rows = [Row(i) for i in range(6)]
+
+    return [
+        ('jwt.decode', lambda: jwt.decode(token, app.secret_key)),
+        ('schema RecipeSchema.loads', lambda: RecipeSchema().loads(recipe)),
+        ('schema CategorySchema.loads', lambda: CategorySchema().loads(category)),
+        ('schema UserSchema.loads', lambda: UserSchema().loads(user)),
+        ('schema LoginSchema.loads', lambda: LoginSchema().loads(login)),
+        ('regex check_mail', lambda: check_mail('sam.achola@example.com')),
+        ('regex check_password', lambda: check_password('Osupportit.0')),
+        ('regex special_character', lambda: special_character('Maindi Choma na Ndimu')),
+        ('serialize page of 6 recipes', lambda: json.dumps({'recipes': [recipe_to_dict(r) for r in rows]})),
+    ]
+
+
+def round_trip_cases(app):
+    from app import db
+    from app.models import Category
+
+    client = app.test_client()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    def post(url, data, headers=None):
+        return client.post(url, data=json.dumps(data), content_type='application/json', headers=headers)
+
+    post('/api-v0/auth/register', {'username': 'benchuser', 'email': 'bench@example.com', 'password': 'Osupportit.0'})
+    login = {'email': 'bench@example.com', 'password': 'Osupportit.0'}
+    headers = {'x-access-token': json.loads(post('/api-v0/auth/login', login).data)['token']}
+    post('/api-v0/category', {'category_name': 'Breakfast', 'category_description': 'Awesome Breakfast'}, headers)
+    for i in range(20):
+        post('/api-v0/recipe', {'title': 'Maindi Choma {}'.format(chr(97 + i)), 'ingredients': 'Maize, lemon',
+                                'steps': 'Roast the maize', 'category_id': 1}, headers)
+
+    def create_and_delete():
+        response = post('/api-v0/category', {'category_name': 'Supper', 'category_description': 'Awesome Supper'}, headers)
+        assert response.status_code == 201, response.data
+        with app.app_context():
+            category_id = db.session.query(db.func.max(Category.id)).scalar()
+        client.delete('/api-v0/category/{}'.format(category_id), headers=headers)
+
+    def cached_listing():
+        app.config['RESPONSE_CACHE_ENABLED'] = True
+        try:
+            client.get('/api-v0/recipe', headers=headers)
+        finally:
+            app.config['RESPONSE_CACHE_ENABLED'] = False
+
+    return [
+        ('http POST /auth/login', lambda: post('/api-v0/auth/login', login)),
+        ('http GET /recipe', lambda: client.get('/api-v0/recipe', headers=headers)),
+        ('http GET /recipe?q=choma', lambda: client.get('/api-v0/recipe?q=choma', headers=headers)),
+        ('http GET /recipe?limit=6', lambda: client.get('/api-v0/recipe?limit=6', headers=headers)),
+        ('http GET /recipe (cached)', cached_listing),
+        ('http GET /recipe/1', lambda: client.get('/api-v0/recipe/1', headers=headers)),
+        ('http GET /recipe/search', lambda: client.get('/api-v0/recipe/search?q=maize', headers=headers)),
+        ('http GET /category', lambda: client.get('/api-v0/category', headers=headers)),
+        ('http GET /category/1', lambda: client.get('/api-v0/category/1', headers=headers)),
+        ('http POST+DELETE /category', create_and_delete),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='pattern', default='', help='only run benchmarks containing this text')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file to compare with / save to')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds spent per benchmark')
+    parser.add_argument('--no-http', action='store_true', help='skip the full request round trips')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': os.getenv('BENCH_DATABASE_URL', 'sqlite://'),
+        'RESPONSE_CACHE_ENABLED': False,
+        'JOBS_IN_PROCESS': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    })
+    cases = unit_cases(app)
+    if not args.no_http:
+        cases += round_trip_cases(app)
+
+    results = [bench(name, fn, min_time=args.min_time) for name, fn in cases if args.pattern in name]
+    regressions = report(results, load_baseline(args.baseline))
+    if args.save:
+        save_baseline(args.baseline, results)
+        print('Saved baseline to {}'.format(args.baseline))
+    return 1 if regressions and not args.save else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
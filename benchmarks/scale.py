@@ -0,0 +1,202 @@
+"""
+Data scale benchmark: seeds synthetic users, categories and recipes and
+measures endpoint latency as the dataset grows.
+
+    python -m benchmarks.scale --scales 1000,10000,100000 --csv scale.csv
+    BENCH_DATABASE_URL=postgresql://localhost/chumvi_bench python -m benchmarks.scale --scales 1000,1000000
+
+Scales are total recipe counts. The benchmark user owns --hot-share of them,
+the rest is spread over the other users. The database tables are dropped
+and recreated, never point BENCH_DATABASE_URL at a database you care about.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+
+CHUNK = 10000
+WORDS = ('maize beans kale ugali chapati rice lemon chilli onion tomato beef chicken fish '
+         'coconut garlic ginger potato cabbage carrot pilau mandazi githeri nyama choma').split()
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+class Seeder(object):
+    """Grows the synthetic dataset in place, chunk by chunk, with executemany inserts."""
+
+    def __init__(self, db, users, categories_per_user, hot_share, seed=42):
+        self.db = db
+        self.users = users
+        self.categories_per_user = categories_per_user
+        self.hot_share = hot_share
+        self.rng = random.Random(seed)
+        self.recipes = 0
+
+    def setup(self):
+        from werkzeug.security import generate_password_hash
+        from app.models import User, Category
+        db = self.db
+        db.drop_all()
+        db.create_all()
+        password = generate_password_hash('Osupportit.0', method='pbkdf2:sha256:1000')
+        for start in range(0, self.users, CHUNK):
+            db.session.execute(User.__table__.insert(), [
+                {'username': 'user{}'.format(i), 'email': 'user{}@example.com'.format(i), 'password': password}
+                for i in range(start + 1, min(start + CHUNK, self.users) + 1)])
+        for start in range(0, self.users, CHUNK // self.categories_per_user or 1):
+            end = min(start + (CHUNK // self.categories_per_user or 1), self.users)
+            db.session.execute(Category.__table__.insert(), [
+                {'category_name': 'category {} {}'.format(u, c), 'category_description': words(self.rng, 8),
+                 'user_id': u}
+                for u in range(start + 1, end + 1) for c in range(self.categories_per_user)])
+        db.session.commit()
+
+    def category_of(self, user_id):
+        # categories were inserted in user order, categories_per_user at a time
+        return (user_id - 1) * self.categories_per_user + 1 + self.rng.randrange(self.categories_per_user)
+
+    def grow(self, total):
+        from app.models import Recipe
+        while self.recipes < total:
+            n = min(CHUNK, total - self.recipes)
+            rows = []
+            for i in range(self.recipes, self.recipes + n):
+                if self.users == 1 or self.rng.random() < self.hot_share:
+                    user_id = 1
+                else:
+                    user_id = self.rng.randrange(2, self.users + 1)
+                rows.append({'title': 'recipe {} {}'.format(words(self.rng, 2), i),
+                             'ingredients': ', '.join(words(self.rng, 1) for _ in range(6)),
+                             'steps': words(self.rng, 40),
+                             'category_id': self.category_of(user_id), 'user_id': user_id})
+            self.db.session.execute(Recipe.__table__.insert(), rows)
+            self.db.session.commit()
+            self.recipes += n
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = fn()
+        timings.append(time.perf_counter() - start)
+        assert response.status_code < 400, response.data
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def measure(app, db, seeder, repeat):
+    """Return [(measurement, median ms)] for the current dataset."""
+    from app.models import Recipe, Category
+    client = app.test_client()
+    login = {'email': 'user1@example.com', 'password': 'Osupportit.0'}
+
+    def post(url, data, headers=None):
+        return client.post(url, data=json.dumps(data), content_type='application/json', headers=headers)
+
+    token = json.loads(post('/api-v0/auth/login', login).data)['token']
+    headers = {'x-access-token': token}
+    with app.app_context():
+        hot = db.session.query(db.func.count(Recipe.id)).filter(Recipe.user_id == 1).scalar()
+        matches = db.session.query(db.func.count(Recipe.id)).filter(Recipe.user_id == 1)\
+            .filter(Recipe.title.ilike('%maize%')).scalar()
+    pages = max(1, (hot + 5) // 6)
+    match_pages = max(1, (matches + 5) // 6)
+
+    def recipes(args):
+        return lambda: client.get('/api-v0/recipe?' + args, headers=headers)
+
+    results = [
+        ('user recipes', hot),
+        ('POST /auth/login', timed(lambda: post('/api-v0/auth/login', login), repeat)),
+        ('GET /recipe first page', timed(recipes('page=1&per_page=6'), repeat)),
+        ('GET /recipe middle page', timed(recipes('page={}&per_page=6'.format(max(1, pages // 2))), repeat)),
+        ('GET /recipe last page', timed(recipes('page={}&per_page=6'.format(pages)), repeat)),
+        ('GET /recipe?q first page', timed(recipes('q=maize&page=1&per_page=6'), repeat)),
+        ('GET /recipe?q middle page', timed(recipes('q=maize&page={}&per_page=6'.format(max(1, match_pages // 2))), repeat)),
+        ('GET /recipe?q last page', timed(recipes('q=maize&page={}&per_page=6'.format(match_pages)), repeat)),
+        ('GET /category', timed(lambda: client.get('/api-v0/category', headers=headers), repeat)),
+    ]
+
+    # every search after an edit has to bring the SQLite search index up to date
+    with app.app_context():
+        recipe = db.session.query(Recipe).filter(Recipe.user_id == 1).order_by(Recipe.id).first()
+        edited = {'ingredients': recipe.ingredients, 'steps': recipe.steps, 'category_id': recipe.category_id}
+    edits = iter(range(10 ** 9))
+
+    def edit_then_search():
+        body = dict(edited, title='edited maize recipe {}'.format(next(edits)))
+        client.put('/api-v0/recipe/{}'.format(recipe.id), data=json.dumps(body),
+                   content_type='application/json', headers=headers)
+        return client.get('/api-v0/recipe/search?q=maize', headers=headers)
+
+    client.get('/api-v0/recipe/search?q=maize', headers=headers)
+    results.append(('PUT /recipe + GET /recipe/search', timed(edit_then_search, repeat)))
+
+    # delete a category holding an average share of the user's recipes
+    with app.app_context():
+        category_id = db.session.query(db.func.min(Category.id)).filter(Category.user_id == 1).scalar()
+        cascade = db.session.query(db.func.count(Recipe.id)).filter(Recipe.category_id == category_id).scalar()
+    start = time.perf_counter()
+    client.delete('/api-v0/category/{}'.format(category_id), headers=headers)
+    results.append(('DELETE /category cascade ({} recipes)'.format(cascade), (time.perf_counter() - start) * 1000))
+    with app.app_context():
+        seeder.recipes -= cascade
+        db.session.execute(Category.__table__.insert(), [
+            {'id': category_id, 'category_name': 'category 1 0', 'category_description': 'restored', 'user_id': 1}])
+        db.session.commit()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1000,10000,100000', help='comma separated total recipe counts')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--categories-per-user', type=int, default=10)
+    parser.add_argument('--hot-share', type=float, default=0.1, help="share of recipes owned by the measured user")
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the median is reported')
+    parser.add_argument('--csv', help='also write the results to this CSV file')
+    args = parser.parse_args(argv)
+    scales = sorted(int(s) for s in args.scales.split(','))
+
+    from app import create_app, db
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': os.getenv('BENCH_DATABASE_URL', 'sqlite:////tmp/chumvi-scale.sqlite'),
+        'RESPONSE_CACHE_ENABLED': False,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    })
+
+    seeder = Seeder(db, args.users, args.categories_per_user, args.hot_share)
+    rows = []
+    with app.app_context():
+        seeder.setup()
+    for scale in scales:
+        start = time.perf_counter()
+        with app.app_context():
+            seeder.grow(scale)
+        print('Seeded {:,} recipes in {:.1f}s'.format(scale, time.perf_counter() - start), file=sys.stderr)
+        for name, value in measure(app, db, seeder, args.repeat):
+            rows.append((scale, name, value))
+
+    names = []
+    for _, name, _ in rows:
+        if name.split(' (')[0] not in names:
+            names.append(name.split(' (')[0])
+    table = dict(((scale, name.split(' (')[0]), value) for scale, name, value in rows)
+    print('{:<32}'.format('ms (median)') + ''.join('{:>14,}'.format(s) for s in scales))
+    for name in names:
+        print('{:<32}'.format(name) + ''.join('{:>14,.2f}'.format(table.get((s, name), float('nan'))) for s in scales))
+
+    if args.csv:
+        with open(args.csv, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(['recipes', 'measurement', 'value'])
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Worker startup benchmark: import time, time to the first response and RSS
+of a fresh interpreter importing the application.
+
+    python -m benchmarks.startup                # run and compare with benchmarks/startup.json
+    python -m benchmarks.startup --save         # run and store the results as the new baseline
+
+Every run is a new process, like a freshly spawned worker.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from .harness import percentile, load_baseline, save_baseline
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'startup.json')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in the child process, prints one JSON line
+PROBE = r"""
+import sys, json, time
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+base = rss_kb()
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+after_import = rss_kb()
+app.test_client().get('/api-v0/category')
+answered = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_response_ms': (answered - imported) * 1000,
+    'import_rss_kb': after_import - base,
+    'rss_kb': rss_kb(),
+    'modules': len(sys.modules),
+}))
+"""
+
+METRICS = (('import_ms', 'import app (ms)'),
+           ('first_response_ms', 'first response (ms)'),
+           ('import_rss_kb', 'RSS added by import (KiB)'),
+           ('rss_kb', 'RSS after first response (KiB)'),
+           ('modules', 'modules loaded'))
+
+
+def probe():
+    output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=ROOT)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='number of fresh processes, medians are reported')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file to compare with / save to')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed growth over the baseline')
+    args = parser.parse_args(argv)
+
+    samples = [probe() for _ in range(args.runs)]
+    results = []
+    for key, name in METRICS:
+        values = sorted(sample[key] for sample in samples)
+        results.append({'name': name, 'value': percentile(values, 50), 'max': values[-1]})
+
+    baseline = load_baseline(args.baseline)
+    regressions = []
+    print('{:<34} {:>12} {:>12} {:>9}'.format('startup', 'median', 'max', 'vs base'))
+    for result in results:
+        change = ''
+        base = baseline.get(result['name'])
+        if base and base['value']:
+            ratio = result['value'] / float(base['value']) - 1
+            change = '{:+.1%}'.format(ratio)
+            if ratio > args.tolerance:
+                regressions.append(result['name'])
+                change += ' !'
+        print('{:<34} {:>12,.1f} {:>12,.1f} {:>9}'.format(result['name'], result['value'], result['max'], change))
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print('Saved baseline to {}'.format(args.baseline))
+    return 1 if regressions and not args.save else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,3 +10,49 @@ MAIL_USE_SSL=True
 MAIL_USE_TLS=False
 MAIL_USERNAME=os.getenv('MAIL_USERNAME')
 MAIL_PASSWORD=os.getenv('MAIL_PASSWORD')
+
+PRINCIPAL_CACHE_SIZE=1024
+PRINCIPAL_CACHE_TTL=5
+SEARCH_INDEX_USERS=256
+RECIPE_BATCH_LIMIT=5000
+IMPORT_BATCH_SIZE=500
+JOBS_IN_PROCESS=True
+JOBS_WORKERS=2
+JOBS_POLL_INTERVAL=5
+JOBS_MAX_ATTEMPTS=5
+JOBS_BACKOFF=30
+# seconds a running job may take before it is assumed lost and requeued
+JOBS_LEASE=600
+SMTP_POOL_SIZE=2
+RESPONSE_CACHE_ENABLED=True
+# 'memory' is per process, only for a single worker
+RESPONSE_CACHE_BACKEND='sqlite'
+# defaults to response-cache.sqlite in the instance folder, created readable by its owner only
+RESPONSE_CACHE_PATH=None
+RESPONSE_CACHE_SIZE=2048
+RESPONSE_CACHE_TTL=300
+PASSWORD_HASH_METHOD='pbkdf2:sha256:150000'
+HASH_EXECUTOR='thread'
+HASH_WORKERS=2
+HASH_MAX_PENDING=8
+HASH_QUEUE_TIMEOUT=2
+QUERY_BUDGET=10
+QUERY_REPEAT_THRESHOLD=5
+METRICS_DIR=os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL=1
+SQLITE_JOURNAL_MODE='WAL'
+SQLITE_SYNCHRONOUS='NORMAL'
+SQLITE_MMAP_SIZE=268435456
+SQLITE_SHARED_CACHE=True
+SQLITE_BUSY_TIMEOUT=5
+SQLITE_POOL_SIZE=16
+APISPEC_PATH=None
+APISPEC_CHECK_INTERVAL=5
+APISPEC_MAX_AGE=86400
+COMPRESS_ENABLED=True
+COMPRESS_MIN_SIZE=500
+COMPRESS_LEVEL=6
+COMPRESS_BROTLI_QUALITY=5
+SQLALCHEMY_REPLICA_URIS=[uri for uri in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if uri]
+SQLALCHEMY_REPLICA_SELECTION='round-robin'
+REPLICA_STICKY_SECONDS=5
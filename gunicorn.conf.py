@@ -0,0 +1,10 @@
+# gunicorn -c gunicorn.conf.py, see the Procfile
+
+
+def child_exit(server, worker):
+    """Fold the metrics file of an exited worker into the archive, before its pid is reused."""
+    from app import app
+    from app.metrics import archive
+    directory = app.config.get('METRICS_DIR')
+    if directory:
+        archive(directory, worker.pid)
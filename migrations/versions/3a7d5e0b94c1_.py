@@ -0,0 +1,40 @@
+"""add ingredients and recipe_ingredients tables
+
+Revision ID: 3a7d5e0b94c1
+Revises: f2b9c83e61a4
+Create Date: 2026-10-18 12:41:50.118345
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7d5e0b94c1'
+down_revision = 'f2b9c83e61a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ingredients',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('recipe_ingredients',
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('ingredient_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ingredient_id'], ['ingredients.id'], ),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('recipe_id', 'ingredient_id')
+    )
+    op.create_index('ix_recipe_ingredients_ingredient_id', 'recipe_ingredients', ['ingredient_id', 'recipe_id'], unique=False)
+    # run `flask backfill-ingredients` afterwards to index existing recipes
+
+
+def downgrade():
+    op.drop_index('ix_recipe_ingredients_ingredient_id', table_name='recipe_ingredients')
+    op.drop_table('recipe_ingredients')
+    op.drop_table('ingredients')
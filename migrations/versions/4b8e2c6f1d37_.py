@@ -0,0 +1,24 @@
+"""add jobs.claimed_at for claim leases
+
+Revision ID: 4b8e2c6f1d37
+Revises: e7f3a9d1c2b5
+Create Date: 2026-10-18 21:12:40.553102
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e2c6f1d37'
+down_revision = 'e7f3a9d1c2b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('jobs', 'claimed_at')
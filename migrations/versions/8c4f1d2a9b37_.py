@@ -0,0 +1,24 @@
+"""add users.token_version
+
+Revision ID: 8c4f1d2a9b37
+Revises: 2abfade57ce9
+Create Date: 2026-10-18 09:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4f1d2a9b37'
+down_revision = '2abfade57ce9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,28 @@
+"""add version and updated_at to recipes and categories
+
+Revision ID: 9e1c4b7a2d60
+Revises: b6e02f7d4c18
+Create Date: 2026-10-18 15:27:48.660114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e1c4b7a2d60'
+down_revision = 'b6e02f7d4c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('categories', 'recipes'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+
+
+def downgrade():
+    for table in ('categories', 'recipes'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
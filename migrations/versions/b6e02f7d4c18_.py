@@ -0,0 +1,36 @@
+"""add jobs table
+
+Revision ID: b6e02f7d4c18
+Revises: 3a7d5e0b94c1
+Create Date: 2026-10-18 14:02:33.907211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e02f7d4c18'
+down_revision = '3a7d5e0b94c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_status_run_at', 'jobs', ['status', 'run_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_jobs_status_run_at', table_name='jobs')
+    op.drop_table('jobs')
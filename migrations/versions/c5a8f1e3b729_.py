@@ -0,0 +1,24 @@
+"""widen users.password for stronger KDF hashes
+
+Revision ID: c5a8f1e3b729
+Revises: 9e1c4b7a2d60
+Create Date: 2026-10-18 16:44:09.381276
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a8f1e3b729'
+down_revision = '9e1c4b7a2d60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('users', 'password', existing_type=sa.String(length=80), type_=sa.String(length=255))
+
+
+def downgrade():
+    op.alter_column('users', 'password', existing_type=sa.String(length=255), type_=sa.String(length=80))
@@ -0,0 +1,40 @@
+"""add indexes for per user recipe and category lookups
+
+Revision ID: d41e7a0c5f92
+Revises: 8c4f1d2a9b37
+Create Date: 2026-10-18 10:03:17.224890
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41e7a0c5f92'
+down_revision = '8c4f1d2a9b37'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_categories_user_id_category_name', 'categories', '(user_id, category_name)'),
+    ('ix_recipes_user_id_id', 'recipes', '(user_id, id)'),
+    ('ix_recipes_user_id_lower_title', 'recipes', '(user_id, lower(title))'),
+    ('ix_recipes_category_id', 'recipes', '(category_id)'),
+    # trigram index so that `title ILIKE '%q%'` can avoid a sequential scan
+    ('ix_recipes_title_trgm', 'recipes', 'USING gin (title gin_trgm_ops)'),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    op.execute('COMMIT')
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, definition in INDEXES:
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}'.format(name, table, definition))
+
+
+def downgrade():
+    op.execute('COMMIT')
+    for name, _, _ in reversed(INDEXES):
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
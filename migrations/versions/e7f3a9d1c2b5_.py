@@ -0,0 +1,43 @@
+"""back duplicate and ownership checks with constraints
+
+Revision ID: e7f3a9d1c2b5
+Revises: c5a8f1e3b729
+Create Date: 2026-10-18 17:35:52.019447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7f3a9d1c2b5'
+down_revision = 'c5a8f1e3b729'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing duplicates have to be cleaned up by hand before this revision can apply
+    op.drop_constraint('recipes_category_id_fkey', 'recipes', type_='foreignkey')
+    op.create_unique_constraint('uq_categories_id_user_id', 'categories', ['id', 'user_id'])
+    op.create_foreign_key('fk_recipes_category_owner', 'recipes', 'categories',
+                          ['category_id', 'user_id'], ['id', 'user_id'])
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    op.execute('COMMIT')
+    op.execute('CREATE UNIQUE INDEX CONCURRENTLY uq_recipes_user_id_lower_title ON recipes (user_id, lower(title))')
+    op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_recipes_user_id_lower_title')
+    op.execute('CREATE UNIQUE INDEX CONCURRENTLY uq_categories_user_id_category_name ON categories (user_id, category_name)')
+    op.execute('ALTER TABLE categories ADD CONSTRAINT uq_categories_user_id_category_name '
+               'UNIQUE USING INDEX uq_categories_user_id_category_name')
+    op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_categories_user_id_category_name')
+
+
+def downgrade():
+    op.execute('CREATE INDEX ix_categories_user_id_category_name ON categories (user_id, category_name)')
+    op.drop_constraint('uq_categories_user_id_category_name', 'categories', type_='unique')
+    op.execute('CREATE INDEX ix_recipes_user_id_lower_title ON recipes (user_id, lower(title))')
+    op.execute('DROP INDEX uq_recipes_user_id_lower_title')
+    op.drop_constraint('fk_recipes_category_owner', 'recipes', type_='foreignkey')
+    op.drop_constraint('uq_categories_id_user_id', 'categories', type_='unique')
+    op.create_foreign_key(None, 'recipes', 'categories', ['category_id'], ['id'])
@@ -0,0 +1,52 @@
+"""add recipes.search_vector for ranked full text search
+
+Revision ID: f2b9c83e61a4
+Revises: d41e7a0c5f92
+Create Date: 2026-10-18 11:20:05.731902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b9c83e61a4'
+down_revision = 'd41e7a0c5f92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('recipes', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute("""
+        CREATE OR REPLACE FUNCTION recipes_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(NEW.ingredients, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(NEW.steps, '')), 'C');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER recipes_search_vector_update BEFORE INSERT OR UPDATE OF title, ingredients, steps
+            ON recipes FOR EACH ROW EXECUTE PROCEDURE recipes_search_vector_update()
+    """)
+    op.execute("""
+        UPDATE recipes SET search_vector =
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(ingredients, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(steps, '')), 'C')
+    """)
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    op.execute('COMMIT')
+    op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recipes_search_vector ON recipes USING gin (search_vector)')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_recipes_search_vector')
+    op.execute('DROP TRIGGER IF EXISTS recipes_search_vector_update ON recipes')
+    op.execute('DROP FUNCTION IF EXISTS recipes_search_vector_update()')
+    op.drop_column('recipes', 'search_vector')
@@ -0,0 +1,63 @@
+import threading
+import socketserver
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept messages and keep them in memory."""
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self.reply('220 localhost test smtp')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline().decode('utf-8')
+            if not line:
+                return
+            command = line.strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith('MAIL FROM'):
+                sender, recipients = line.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif command.startswith('RCPT TO'):
+                recipients.append(line.split(':', 1)[1].strip())
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    line = self.rfile.readline().decode('utf-8')
+                    if line in ('.\r\n', '.\n', ''):
+                        break
+                    data.append(line)
+                self.server.messages.append((sender, recipients, ''.join(data)))
+                self.reply('250 OK')
+            elif command in ('NOOP', 'RSET'):
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    """Local stand-in SMTP server, listens on a free port of localhost."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), SMTPHandler)
+        self.messages = []
+        self.port = self.server_address[1]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
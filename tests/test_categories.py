@@ -1,6 +1,13 @@
+import os
 import json
+import time
+import stat
+import shutil
+import tempfile
 from werkzeug.datastructures import Headers
 from tests import ApiTestCase
+from app import app
+from app.response_cache import MemoryBackend, SQLiteBackend, response_cache
 
 class CategoryTestCase(ApiTestCase):
     def test_add_category(self):
@@ -90,6 +97,85 @@ class CategoryTestCase(ApiTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual('breakfast', data['categories'][0]['category_name'])
 
+    def test_get_categories_paginated_and_streamed(self):
+        """Tests cursor pagination and streaming of categories."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        for name in ['Breakfast', 'Dinner', 'Supper']:
+            self.tester.post('/api-v0/category', data=json.dumps({'category_name': name, 'category_description': 'Awesome food'}), content_type='application/json', headers=h)
+
+        response = self.tester.get('/api-v0/category?limit=2', headers=h)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(['breakfast', 'dinner'], [c['category_name'] for c in data['categories']])
+        response = self.tester.get('/api-v0/category?limit=2&after=' + data['next'], headers=h)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(['supper'], [c['category_name'] for c in data['categories']])
+
+        response = self.tester.get('/api-v0/category?stream=1', headers=h)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(3, len(data['categories']))
+
+    def test_get_categories_is_cached(self):
+        """Tests that category listings are cached until the user writes."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+
+        self.assertEqual('MISS', self.tester.get('/api-v0/category', headers=h).headers['X-Cache'])
+        self.assertEqual('HIT', self.tester.get('/api-v0/category', headers=h).headers['X-Cache'])
+        self.tester.post('/api-v0/category', data=json.dumps({'category_name': 'Dinner', 'category_description': 'Awesome Dinner'}), content_type='application/json', headers=h)
+        response = self.tester.get('/api-v0/category', headers=h)
+        self.assertEqual('MISS', response.headers['X-Cache'])
+        self.assertEqual(2, len(json.loads(response.get_data(as_text=True))['categories']))
+
+    def test_cache_generations_do_not_expire(self):
+        """Tests that generation counters outlive the entry TTL of both backends."""
+        for backend in [MemoryBackend(16, ttl=0.01), SQLiteBackend(':memory:', ttl=0.01)]:
+            self.assertEqual(1, backend.incr('gen:1'))
+            time.sleep(0.02)
+            self.assertEqual(2, backend.incr('gen:1'))
+            self.assertEqual(2, backend.get('gen:1'))
+
+    def test_sqlite_cache_file_is_private_and_namespaced(self):
+        """Tests that the shared cache file is owner only, holds JSON and keeps databases apart."""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'cache', 'response-cache.sqlite')
+            config = app.config
+            original = config.get('RESPONSE_CACHE_PATH')
+            config['RESPONSE_CACHE_PATH'] = path
+            try:
+                with app.app_context():
+                    response_cache.clear()
+                    backend = response_cache.backend
+                    self.assertIs(backend, app.extensions['response_cache'])
+            finally:
+                config['RESPONSE_CACHE_PATH'] = original
+                app.extensions.pop('response_cache', None)
+            self.assertEqual(0o600, stat.S_IMODE(os.stat(path).st_mode))
+
+            entry = [b'\x1f\x8b body', 200, [['Content-Type', 'application/json']], {'gzip': b'\x00\xff'}]
+            backend.set('resp2:1', entry, 60)
+            self.assertEqual(entry, backend.get('resp2:1'))
+            raw = backend._connection().execute('SELECT value FROM cache WHERE key = ?', (backend.prefix + 'resp2:1',)).fetchone()[0]
+            self.assertEqual(entry[1], json.loads(raw)[1])
+
+            other = SQLiteBackend(path, 60, 'otherdatabase')
+            self.assertIsNone(other.get('resp2:1'))
+            other.incr('gen:1')
+            backend.clear()
+            self.assertIsNone(backend.get('resp2:1'))
+            self.assertEqual(1, other.get('gen:1'))
+        finally:
+            shutil.rmtree(directory)
+
     def test_edit_category(self):
         """Test edit category."""
         self.register()
@@ -0,0 +1,70 @@
+import gzip
+import json
+from werkzeug.datastructures import Headers
+from tests import ApiTestCase
+from app.response_cache import response_cache
+
+class CompressionTestCase(ApiTestCase):
+    def auth_headers(self):
+        """Register, login, add recipes and return the token headers."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        h = Headers()
+        h.add('x-access-token', json.loads(res.data)['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        for title in ['Maindi Choma', 'Ugali Sukuma', 'Chapati Beans']:
+            recipe = {'title': title, 'ingredients': 'Maindi, Ndimu, Pilipili, Chumvi',
+                      'steps': 'Choma maindi juu ya makaa, kisha paka ndimu na pilipili. ' * 4, 'category_id': 1}
+            self.tester.post('/api-v0/recipe', data=json.dumps(recipe), content_type='application/json', headers=h)
+        return h
+
+    def test_gzip_negotiation(self):
+        """Tests that large bodies are gzipped for clients accepting it and get their own ETag."""
+        h = self.auth_headers()
+        plain = self.tester.get('/api-v0/recipe?fields=all', headers=h)
+        self.assertNotIn('Content-Encoding', plain.headers)
+
+        h.add('Accept-Encoding', 'gzip, deflate')
+        response = self.tester.get('/api-v0/recipe?fields=all', headers=h)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(plain.data, gzip.decompress(response.data))
+        etag = response.headers['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+
+        h.add('If-None-Match', etag)
+        response = self.tester.get('/api-v0/recipe?fields=all', headers=h)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(etag, response.headers['ETag'])
+
+    def test_small_bodies_are_not_compressed(self):
+        """Tests that bodies below COMPRESS_MIN_SIZE are sent as they are."""
+        h = self.auth_headers()
+        h.add('Accept-Encoding', 'gzip')
+        response = self.tester.get('/api-v0/category/1', headers=h)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_cached_responses_reuse_compressed_bytes(self):
+        """Tests that response cache hits are served precompressed."""
+        h = self.auth_headers()
+        h.add('Accept-Encoding', 'gzip')
+        first = self.tester.get('/api-v0/recipe?fields=all', headers=h)
+        second = self.tester.get('/api-v0/recipe?fields=all', headers=h)
+        self.assertEqual('HIT', second.headers['X-Cache'])
+        self.assertEqual('gzip', second.headers['Content-Encoding'])
+        self.assertEqual(gzip.decompress(first.data), gzip.decompress(second.data))
+        self.assertEqual(first.headers['ETag'], second.headers['ETag'])
+
+        third = self.tester.get('/api-v0/recipe?fields=all', headers=h)
+        self.assertEqual(second.data, third.data)
+        self.assertEqual(3, response_cache.stats()['hits'] + response_cache.stats()['misses'])
+
+    def test_streamed_export_is_compressed(self):
+        """Tests that streamed responses are compressed as they stream."""
+        h = self.auth_headers()
+        h.add('Accept-Encoding', 'gzip')
+        response = self.tester.get('/api-v0/export', headers=h)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(4, len(gzip.decompress(response.data).splitlines()))
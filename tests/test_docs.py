@@ -0,0 +1,40 @@
+import gzip
+import json
+from tests import ApiTestCase
+
+class DocsTestCase(ApiTestCase):
+    def test_spec_documents_api_routes(self):
+        """Tests that the lazily built spec describes the API routes."""
+        res = self.tester.get('/apispec_1.json')
+        self.assertEqual(res.status_code, 200)
+        spec = json.loads(res.data)
+        self.assertIn('/api-v0/recipe', spec['paths'])
+        self.assertIn('post', spec['paths']['/api-v0/auth/login'])
+
+    def test_swagger_ui(self):
+        """Tests that the Swagger UI is served."""
+        res = self.tester.get('/apidocs/')
+        self.assertEqual(res.status_code, 200)
+
+    def test_spec_is_cached(self):
+        """Tests that the spec is served with a strong ETag and honours If-None-Match."""
+        res = self.tester.get('/apispec_1.json')
+        etag = res.headers['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('max-age', res.headers['Cache-Control'])
+        res = self.tester.get('/apispec_1.json', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+    def test_spec_is_precompressed(self):
+        """Tests that clients accepting gzip get the compressed spec."""
+        plain = self.tester.get('/apispec_1.json')
+        res = self.tester.get('/apispec_1.json', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+        # a different representation, a different strong ETag
+        etag = res.headers['ETag']
+        self.assertNotEqual(etag, plain.headers['ETag'])
+        self.assertTrue(etag.endswith('-gzip"'))
+        res = self.tester.get('/apispec_1.json', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
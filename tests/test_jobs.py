@@ -0,0 +1,58 @@
+import json
+import datetime
+from sqlalchemy import event
+from tests import ApiTestCase
+from app import app, db, jobs
+from app.models import Job
+
+ran = []
+
+
+@jobs.job('record')
+def record(value):
+    ran.append(value)
+
+
+class JobsTestCase(ApiTestCase):
+    def setUp(self):
+        super(JobsTestCase, self).setUp()
+        del ran[:]
+
+    def add_job(self, value, **columns):
+        new_job = Job(kind='record', payload=json.dumps({'value': value}))
+        for column, setting in columns.items():
+            setattr(new_job, column, setting)
+        db.session.add(new_job)
+        db.session.commit()
+        return new_job.id
+
+    def test_claim_is_compare_and_set(self):
+        """Tests that a job claimed by another worker between the select and the update is skipped."""
+        first, second = self.add_job(1), self.add_job(2)
+        raced = []
+
+        def race(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE jobs') and not raced:
+                raced.append(True)
+                conn.execute(Job.__table__.update().where(Job.id == first).values(status='running'))
+        event.listen(db.engine, 'before_cursor_execute', race)
+        try:
+            with app.app_context():
+                claimed = jobs.claim_job()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', race)
+        self.assertEqual(second, claimed.id)
+        self.assertEqual(1, claimed.attempts)
+        self.assertIsNotNone(claimed.claimed_at)
+
+    def test_stale_jobs_are_requeued(self):
+        """Tests that running jobs past their lease run again, or fail once out of attempts."""
+        expired = datetime.datetime.utcnow() - datetime.timedelta(seconds=app.config.get('JOBS_LEASE', 600) + 1)
+        lost = self.add_job(1, status='running', attempts=1, claimed_at=expired)
+        exhausted = self.add_job(2, status='running', attempts=app.config.get('JOBS_MAX_ATTEMPTS', 5), claimed_at=expired)
+        running = self.add_job(3, status='running', attempts=1, claimed_at=datetime.datetime.utcnow())
+        with app.app_context():
+            self.assertEqual(1, jobs.run_pending())
+        self.assertEqual([1], ran)
+        self.assertEqual(['done', 'failed', 'running'],
+                         [Job.query.get(job_id).status for job_id in (lost, exhausted, running)])
@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+from tests import ApiTestCase
+from app import app
+from app.metrics import registry, archive
+
+class MetricsTestCase(ApiTestCase):
+    def setUp(self):
+        super(MetricsTestCase, self).setUp()
+        registry.reset()
+        self.metrics_dir = tempfile.mkdtemp()
+        app.config['METRICS_DIR'] = self.metrics_dir
+
+    def tearDown(self):
+        app.config['METRICS_DIR'] = None
+        shutil.rmtree(self.metrics_dir)
+        super(MetricsTestCase, self).tearDown()
+
+    def test_metrics_are_aggregated_across_workers(self):
+        """Tests that /metrics adds up the snapshots written by other workers."""
+        self.register()
+        other_worker = {
+            'pid': 999999,
+            'requests': [[['auth', 'auth.register', 'POST', 201], 2]],
+            'histograms': [['chumvi_http_request_duration_seconds', ['auth', 'auth.register'], [[0, 0, 0, 1, 2, 2, 2, 2, 2, 2, 2], 0.1, 2]]],
+            'in_flight': 3,
+            'cache': [1, 1],
+        }
+        with open(os.path.join(self.metrics_dir, 'metrics-999999.json'), 'w') as f:
+            json.dump(other_worker, f)
+
+        response = self.tester.get('/metrics')
+        body = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('chumvi_http_requests_total{blueprint="auth",endpoint="auth.register",method="POST",status="201"} 3', body)
+        self.assertIn('chumvi_http_request_duration_seconds_count{blueprint="auth",endpoint="auth.register"} 3', body)
+        # the other worker is gone, its in flight requests are not
+        self.assertIn('chumvi_http_requests_in_flight 0', body)
+
+    def test_last_requests_are_flushed_when_idle(self):
+        """Tests that requests made within the flush interval are written once it ends."""
+        app.config['METRICS_FLUSH_INTERVAL'] = 0.2
+        try:
+            self.register()
+            self.register()
+            time.sleep(0.4)
+        finally:
+            app.config['METRICS_FLUSH_INTERVAL'] = 1
+        with open(os.path.join(self.metrics_dir, 'metrics-{}.json'.format(os.getpid()))) as f:
+            snapshot = json.load(f)
+        self.assertEqual(2, sum(value for _, value in snapshot['requests']))
+
+    def test_exited_workers_are_archived(self):
+        """Tests that an exited worker's totals are kept after its file is removed and its pid reused."""
+        self.register()
+        exited = {
+            'pid': 999999,
+            'requests': [[['auth', 'auth.register', 'POST', 201], 2]],
+            'histograms': [],
+            'in_flight': 1,
+            'cache': [1, 1],
+        }
+        path = os.path.join(self.metrics_dir, 'metrics-999999.json')
+        for requests in (2, 1):
+            exited['requests'][0][1] = requests
+            with open(path, 'w') as f:
+                json.dump(exited, f)
+            archive(self.metrics_dir, 999999)
+            self.assertFalse(os.path.exists(path))
+        # a new worker with the same pid starts from zero
+        exited['requests'][0][1] = 1
+        with open(path, 'w') as f:
+            json.dump(exited, f)
+
+        body = self.tester.get('/metrics').get_data(as_text=True)
+        self.assertIn('chumvi_http_requests_total{blueprint="auth",endpoint="auth.register",method="POST",status="201"} 5', body)
+        self.assertIn('chumvi_response_cache_requests_total{result="hit"} 3', body)
+        self.assertEqual(sorted(['archive.json', 'metrics-999999.json', 'metrics-{}.json'.format(os.getpid())]),
+                         sorted(os.listdir(self.metrics_dir)))
@@ -0,0 +1,96 @@
+import json
+from werkzeug.datastructures import Headers
+from tests import ApiTestCase
+from sqlalchemy.exc import OperationalError
+from app import app, db
+from app.auth import reset_serializer
+
+class QueryCountTestCase(ApiTestCase):
+    """Query budgets per route, so that added round trips fail the suite."""
+
+    def setUp(self):
+        super(QueryCountTestCase, self).setUp()
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        self.h = Headers()
+        self.h.add('x-access-token', json.loads(res.data)['token'])
+        # fill the principal cache
+        self.tester.get('/api-v0/category', headers=self.h)
+        self.recipe = {'title': 'Maindi Choma', 'ingredients': 'Maindi, Ndimu', 'steps': 'Choma maindi', 'category_id': 1}
+
+    def post(self, url, data):
+        return self.tester.post(url, data=json.dumps(data), content_type='application/json', headers=self.h)
+
+    def put(self, url, data):
+        return self.tester.put(url, data=json.dumps(data), content_type='application/json', headers=self.h)
+
+    def test_auth_queries(self):
+        """Tests query counts of the auth routes."""
+        with self.assertMaxQueries(1):
+            self.tester.post('/api-v0/auth/register', data=json.dumps({'username': 'another', 'email': 'another@example.com', 'password': 'Osupportit.0'}), content_type='application/json')
+        with self.assertMaxQueries(1):
+            self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        with self.assertMaxQueries(2):
+            self.tester.post('/api-v0/auth/forgot_password', data=json.dumps({'email': 'test@example.com'}), content_type='application/json')
+
+    def test_reset_password_queries(self):
+        """Tests the query count of a password reset."""
+        with app.app_context():
+            token = reset_serializer().dumps('test@example.com', salt='reset_salt')
+        with self.assertMaxQueries(2):
+            response = self.tester.post('/api-v0/auth/reset_password/' + token, content_type='application/json',
+                                        data=json.dumps({'password': 'Osupportit.1', 'confirm_password': 'Osupportit.1'}))
+        self.assertEqual(response.status_code, 201)
+
+    def test_category_queries(self):
+        """Tests query counts of the category routes."""
+        with self.assertMaxQueries(1):
+            self.post('/api-v0/category', self.category_data)
+        with self.assertMaxQueries(2):
+            self.tester.get('/api-v0/category', headers=self.h)
+        with self.assertMaxQueries(0):
+            self.tester.get('/api-v0/category', headers=self.h)
+        with self.assertMaxQueries(1):
+            self.tester.get('/api-v0/category/1', headers=self.h)
+        with self.assertMaxQueries(2):
+            self.put('/api-v0/category/1', {'category_name': 'Dinner', 'category_description': 'Awesome Dinner'})
+        self.post('/api-v0/recipe', self.recipe)
+        with self.assertMaxQueries(6):
+            self.tester.delete('/api-v0/category/1', headers=self.h)
+
+    def test_recipe_queries(self):
+        """Tests query counts of the recipe routes."""
+        self.post('/api-v0/category', self.category_data)
+        with self.assertMaxQueries(5):
+            self.post('/api-v0/recipe', self.recipe)
+        # the list ETag, then the items and the COUNT of paginate
+        with self.assertMaxQueries(3):
+            self.tester.get('/api-v0/recipe', headers=self.h)
+        with self.assertMaxQueries(0):
+            self.tester.get('/api-v0/recipe', headers=self.h)
+        with self.assertMaxQueries(2):
+            self.tester.get('/api-v0/recipe?limit=5', headers=self.h)
+        with self.assertMaxQueries(1):
+            self.tester.get('/api-v0/recipe/1', headers=self.h)
+        with self.assertMaxQueries(3):
+            self.tester.get('/api-v0/recipe/search?q=maindi', headers=self.h)
+        with self.assertMaxQueries(1):
+            self.tester.get('/api-v0/recipe/cook?ingredients=ndimu', headers=self.h)
+        with self.assertMaxQueries(4):
+            self.put('/api-v0/recipe/1', dict(self.recipe, title='Maindi Boilo'))
+        with self.assertMaxQueries(4):
+            self.tester.delete('/api-v0/recipe/1', headers=self.h)
+
+    def test_batch_queries_do_not_grow_with_size(self):
+        """Tests that batch creation costs the same number of queries for any batch size."""
+        self.post('/api-v0/category', self.category_data)
+        recipes = [dict(self.recipe, title='Maindi Choma {}'.format(chr(97 + i))) for i in range(20)]
+        with self.assertMaxQueries(8):
+            self.post('/api-v0/recipe/batch', recipes)
+
+    def test_failed_statements_do_not_leak_timings(self):
+        """Tests that the start time of a failing statement is dropped with it."""
+        with db.engine.connect() as conn:
+            with self.assertRaises(OperationalError):
+                conn.execute('SELECT * FROM no_such_table')
+            self.assertEqual([], conn.info['query_start'])
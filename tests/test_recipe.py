@@ -1,6 +1,13 @@
 import json
+from contextlib import contextmanager
+from sqlalchemy import event
 from werkzeug.datastructures import Headers
 from tests import ApiTestCase
+from app import db
+from app.models import Recipe, Ingredient
+from app.ingredients import parse_ingredients
+from app.pagination import encode_cursor
+from app.search import indexes
 
 class RecipeTestCase(ApiTestCase):
     def test_add_recipe(self):
@@ -247,4 +254,235 @@ class RecipeTestCase(ApiTestCase):
         response = self.tester.delete('/api-v0/recipe/1', headers=h)
         resp = json.loads(response.data)
         self.assertEqual(response.status_code, 201)
-        self.assertEqual('Recipe deleted successfully', resp['message'])
\ No newline at end of file
+        self.assertEqual('Recipe deleted successfully', resp['message'])
+    def test_search_recipes(self):
+        """Tests ranked search over titles, ingredients and steps."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipes = [
+            {'title': 'Ugali Sukuma', 'ingredients': 'Maize flour, kale', 'steps': 'Cook ugali', 'category_id': 1},
+            {'title': 'Maindi Choma', 'ingredients': 'Maize, lemon', 'steps': 'Roast the maize', 'category_id': 1},
+        ]
+        for recipe in recipes:
+            self.tester.post('/api-v0/recipe', data=json.dumps(recipe), content_type='application/json', headers=h)
+        response = self.tester.get('/api-v0/recipe/search?q=maize', headers=h)
+        resp = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(['maindi choma', 'ugali sukuma'], [r['title'] for r in resp['recipes']])
+
+        response = self.tester.get('/api-v0/recipe/search?q=kale', headers=h)
+        self.assertEqual(['ugali sukuma'], [r['title'] for r in json.loads(response.data)['recipes']])
+
+        # a change committed by another worker, which this process never saw
+        db.session.execute(Recipe.__table__.update().where(Recipe.id == 1)
+                           .values(ingredients='Maize flour, spinach', version=Recipe.version + 1))
+        db.session.commit()
+        response = self.tester.get('/api-v0/recipe/search?q=kale', headers=h)
+        self.assertEqual([], json.loads(response.data)['recipes'])
+
+        # edits are applied to the loaded index instead of rebuilding it
+        index = indexes.get(1)
+        edit = {'title': 'Ugali Kale', 'ingredients': 'Maize flour, kale', 'steps': 'Cook ugali', 'category_id': 1}
+        self.tester.put('/api-v0/recipe/1', data=json.dumps(edit), content_type='application/json', headers=h)
+        response = self.tester.get('/api-v0/recipe/search?q=kale', headers=h)
+        self.assertEqual(['ugali kale'], [r['title'] for r in json.loads(response.data)['recipes']])
+        self.tester.delete('/api-v0/recipe/2', headers=h)
+        response = self.tester.get('/api-v0/recipe/search?q=maize', headers=h)
+        self.assertEqual(['ugali kale'], [r['title'] for r in json.loads(response.data)['recipes']])
+        self.assertIs(index, indexes.get(1))
+
+    def test_cook_with_ingredients(self):
+        """Tests finding recipes by the ingredients at hand."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipes = [
+            {'title': 'Ugali Sukuma', 'ingredients': 'Maize flour, Kale, Onions', 'steps': 'Cook ugali', 'category_id': 1},
+            {'title': 'Maindi Choma', 'ingredients': 'Maize flour, lemon', 'steps': 'Roast the maize', 'category_id': 1},
+        ]
+        for recipe in recipes:
+            self.tester.post('/api-v0/recipe', data=json.dumps(recipe), content_type='application/json', headers=h)
+        response = self.tester.get('/api-v0/recipe/cook?ingredients=maize flour,lemon', headers=h)
+        resp = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(['maindi choma', 'ugali sukuma'], [r['title'] for r in resp['recipes']])
+        self.assertEqual(1.0, resp['recipes'][0]['coverage'])
+        # names are kept as they are, no plural guessing
+        self.assertEqual(['hummus', 'molasses', 'onions'], parse_ingredients('Hummus, Molasses and Onions'))
+        for limit in ['0', '-1', 'many']:
+            response = self.tester.get('/api-v0/recipe/cook?ingredients=lemon&limit=' + limit, headers=h)
+            self.assertEqual(response.status_code, 422)
+        response = self.tester.get('/api-v0/recipe/cook?ingredients=lemon&limit=100000', headers=h)
+        self.assertEqual(response.status_code, 200)
+
+    def test_concurrently_added_ingredient(self):
+        """Tests that an ingredient another request adds at the same time does not fail the recipe."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        h = Headers()
+        h.add('x-access-token', json.loads(res.data)['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipe = {'title': 'Ugali Sukuma', 'ingredients': 'Maize flour, Kale', 'steps': 'Cook ugali', 'category_id': 1}
+        with self.concurrent_ingredient('kale'):
+            response = self.tester.post('/api-v0/recipe', data=json.dumps(recipe), content_type='application/json', headers=h)
+        self.assertEqual(response.status_code, 201)
+        response = self.tester.get('/api-v0/recipe/cook?ingredients=kale', headers=h)
+        self.assertEqual(['ugali sukuma'], [r['title'] for r in json.loads(response.data)['recipes']])
+
+    def test_batch_with_concurrently_added_ingredient(self):
+        """Tests that a batch is not failed by an ingredient another request just added."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        h = Headers()
+        h.add('x-access-token', json.loads(res.data)['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipes = [
+            {'title': 'Ugali Sukuma', 'ingredients': 'Maize flour, Kale', 'steps': 'Cook ugali', 'category_id': 1},
+            {'title': 'Githeri', 'ingredients': 'Maize, Beans, Kale', 'steps': 'Boil githeri', 'category_id': 1},
+        ]
+        with self.concurrent_ingredient('kale'):
+            response = self.tester.post('/api-v0/recipe/batch', data=json.dumps({'recipes': recipes}), content_type='application/json', headers=h)
+        self.assertEqual(response.status_code, 201)
+        response = self.tester.get('/api-v0/recipe/cook?ingredients=kale', headers=h)
+        self.assertEqual(['githeri', 'ugali sukuma'], sorted(r['title'] for r in json.loads(response.data)['recipes']))
+
+    @contextmanager
+    def concurrent_ingredient(self, name):
+        """Insert the ingredient name right before the app inserts new ingredients, like a racing request would."""
+        inserted = []
+
+        def insert(conn, cursor, statement, parameters, context, executemany):
+            if 'INTO ingredients' in statement and not inserted:
+                inserted.append(name)
+                conn.execute(Ingredient.__table__.insert(), name=name)
+        event.listen(db.engine, 'before_cursor_execute', insert)
+        try:
+            yield
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', insert)
+        self.assertEqual([name], inserted)
+
+    def test_get_recipes_with_cursor(self):
+        """Tests keyset pagination of recipes."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        for title in ['Maindi Choma', 'Ugali Sukuma', 'Chapati Beans']:
+            recipe = {'title': title, 'ingredients': 'Maindi Ndimu', 'steps': 'Choma maindi', 'category_id': 1}
+            self.tester.post('/api-v0/recipe', data=json.dumps(recipe), content_type='application/json', headers=h)
+
+        response = self.tester.get('/api-v0/recipe?limit=2&order=title', headers=h)
+        resp = json.loads(response.data)
+        self.assertEqual(['chapati beans', 'maindi choma'], [r['title'] for r in resp['recipes']])
+        response = self.tester.get('/api-v0/recipe?limit=2&order=title&after=' + resp['next'], headers=h)
+        resp = json.loads(response.data)
+        self.assertEqual(['ugali sukuma'], [r['title'] for r in resp['recipes']])
+        self.assertIsNone(resp['next'])
+
+        response = self.tester.get('/api-v0/recipe?limit=2&after=garbage', headers=h)
+        self.assertEqual(response.status_code, 422)
+        for order, key in [('title', [1]), ('title', [1, 'chapati beans']), ('id', ['1']), ('id', [True]), ('id', [[1]])]:
+            response = self.tester.get('/api-v0/recipe?limit=2&order={}&after={}'.format(order, encode_cursor(order, key)), headers=h)
+            self.assertEqual(response.status_code, 422)
+
+    def test_add_recipes_in_batch(self):
+        """Tests batch creation with per item errors."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipes = [
+            {'title': 'Maindi Choma', 'ingredients': 'Maindi, Ndimu', 'steps': 'Choma maindi', 'category_id': 1},
+            {'title': 'Maindi Choma', 'ingredients': 'Maindi, Ndimu', 'steps': 'Choma maindi', 'category_id': 1},
+            {'title': 'Ugali Sukuma', 'ingredients': 'Maize flour', 'steps': 'Cook ugali', 'category_id': 7},
+            {'title': 'Ug', 'ingredients': 'Maize flour', 'steps': 'Cook ugali', 'category_id': 1},
+            {'title': 'Chapati Beans', 'ingredients': 'Flour, Beans', 'steps': 'Cook chapati', 'category_id': '1'},
+        ]
+        response = self.tester.post('/api-v0/recipe/batch', data=json.dumps({'recipes': recipes}), content_type='application/json', headers=h)
+        resp = json.loads(response.data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(['maindi choma', 'chapati beans'], [r['title'] for r in resp['recipes']])
+        self.assertEqual(['1', '2', '3'], sorted(resp['errors']))
+        response = self.tester.get('/api-v0/recipe/cook?ingredients=ndimu', headers=h)
+        self.assertEqual(1, len(json.loads(response.data)['recipes']))
+
+    def test_conditional_get(self):
+        """Tests ETag/If-None-Match handling on recipe reads."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipe = {'title': 'Maindi Choma', 'ingredients': 'Maindi Ndimu', 'steps': 'Choma maindi', 'category_id': 1}
+        self.tester.post('/api-v0/recipe', data=json.dumps(recipe), content_type='application/json', headers=h)
+
+        for url in ['/api-v0/recipe/1', '/api-v0/recipe']:
+            response = self.tester.get(url, headers=h)
+            etag = response.headers['ETag']
+            h2 = Headers(h)
+            h2.add('If-None-Match', etag)
+            response = self.tester.get(url, headers=h2)
+            self.assertEqual(response.status_code, 304)
+
+        recipe['title'] = 'Maindi Boilo'
+        self.tester.put('/api-v0/recipe/1', data=json.dumps(recipe), content_type='application/json', headers=h)
+        response = self.tester.get('/api-v0/recipe', headers=h2)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(etag, response.headers['ETag'])
+
+    def test_sparse_fieldsets(self):
+        """Tests the summary listing and the fields parameter."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipe = {'title': 'Maindi Choma', 'ingredients': 'Maindi Ndimu', 'steps': 'Choma maindi', 'category_id': 1}
+        self.tester.post('/api-v0/recipe', data=json.dumps(recipe), content_type='application/json', headers=h)
+
+        response = self.tester.get('/api-v0/recipe', headers=h)
+        self.assertEqual(['category_id', 'id', 'title'], sorted(json.loads(response.data)['recipes'][0]))
+        response = self.tester.get('/api-v0/recipe?fields=all', headers=h)
+        self.assertEqual('Choma maindi', json.loads(response.data)['recipes'][0]['steps'])
+        response = self.tester.get('/api-v0/recipe/1?fields=id,steps', headers=h)
+        self.assertEqual({'id': 1, 'steps': 'Choma maindi'}, json.loads(response.data)['recipe'])
+        response = self.tester.get('/api-v0/recipe?limit=5&fields=title', headers=h)
+        self.assertEqual([{'title': 'maindi choma'}], json.loads(response.data)['recipes'])
+        response = self.tester.get('/api-v0/recipe?fields=id,password', headers=h)
+        self.assertEqual(response.status_code, 422)
+
+    def test_add_duplicate_recipe_and_foreign_category(self):
+        """Tests the constraint backed duplicate and category ownership checks."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        data = json.loads(res.data)
+        h = Headers()
+        h.add('x-access-token', data['token'])
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipe_items = {'title': 'Maindi Choma', 'ingredients': 'Maindi Ndimu', 'steps': 'Choma maindi', 'category_id': 1}
+        self.tester.post('/api-v0/recipe', data=json.dumps(recipe_items), content_type='application/json', headers=h)
+
+        recipe_items['title'] = 'MAINDI choma'
+        response = self.tester.post('/api-v0/recipe', data=json.dumps(recipe_items), content_type='application/json', headers=h)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual('Recipe with similar name already exists', json.loads(response.data)['message'])
+
+        recipe_items['title'] = 'Ugali Sukuma'
+        recipe_items['category_id'] = 7
+        response = self.tester.post('/api-v0/recipe', data=json.dumps(recipe_items), content_type='application/json', headers=h)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual('Could not Find a matching category id.', json.loads(response.data)['message'])
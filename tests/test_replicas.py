@@ -0,0 +1,116 @@
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from werkzeug.datastructures import Headers
+from app import create_app, db
+from app.helpers import principal_cache
+from app.replicas import choose_replica
+from app.search import indexes
+
+REPLICA_CONFIG = {
+    'TESTING': True,
+    'SECRET_KEY': 'Ochunglobotho',
+    'JOBS_IN_PROCESS': False,
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    'RESPONSE_CACHE_ENABLED': False,
+}
+
+class ReplicaTestCase(unittest.TestCase):
+    """Two local SQLite files stand in for the primary and its replica."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary = os.path.join(self.directory, 'primary.sqlite')
+        self.replica = os.path.join(self.directory, 'replica.sqlite')
+        principal_cache.clear()
+        indexes.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_app(self, **config):
+        config = dict(REPLICA_CONFIG, SQLALCHEMY_DATABASE_URI='sqlite:///' + self.primary,
+                      SQLALCHEMY_REPLICA_URIS=['sqlite:///' + self.replica],
+                      RESPONSE_CACHE_PATH=os.path.join(self.directory, 'cache.sqlite'), **config)
+        app = create_app(config)
+        with app.app_context():
+            db.create_all()
+            db.Model.metadata.create_all(bind=db.get_engine(app, 'replica_0'))
+        return app
+
+    def replicate(self, app):
+        """Copy the primary over the replica, the way replication eventually would."""
+        with app.app_context():
+            db.get_engine(app, 'replica_0').dispose()
+        conn = sqlite3.connect(self.replica)
+        conn.execute('ATTACH DATABASE ? AS primary_db', (self.primary,))
+        for table in db.Model.metadata.sorted_tables:
+            conn.execute('DELETE FROM {}'.format(table.name))
+            conn.execute('INSERT INTO {0} SELECT * FROM primary_db.{0}'.format(table.name))
+        conn.commit()
+        conn.close()
+
+    def auth_headers(self, app):
+        tester = app.test_client()
+        tester.post('/api-v0/auth/register', content_type='application/json', data=json.dumps(
+            {'username': 'testuser', 'email': 'test@example.com', 'password': 'Osupportit.0'}))
+        res = tester.post('/api-v0/auth/login', content_type='application/json', data=json.dumps(
+            {'email': 'test@example.com', 'password': 'Osupportit.0'}))
+        h = Headers()
+        h.add('x-access-token', json.loads(res.data)['token'])
+        return tester, h
+
+    def add_category(self, tester, h):
+        return tester.post('/api-v0/category', headers=h, content_type='application/json',
+                           data=json.dumps({'category_name': 'Breakfast', 'category_description': 'Awesome Breakfast'}))
+
+    def categories(self, tester, h):
+        return json.loads(tester.get('/api-v0/category', headers=h).data)['categories']
+
+    def test_reads_go_to_the_replica(self):
+        """Tests that writes go to the primary and GET requests read the replica."""
+        app = self.create_app(REPLICA_STICKY_SECONDS=0)
+        tester, h = self.auth_headers(app)
+        self.replicate(app)
+
+        self.assertEqual(self.add_category(tester, h).status_code, 201)
+        self.assertEqual([], self.categories(tester, h))
+        self.replicate(app)
+        self.assertEqual(['breakfast'], [c['category_name'] for c in self.categories(tester, h)])
+
+    def test_read_your_writes(self):
+        """Tests that a user's reads stay on the primary right after they write."""
+        app = self.create_app(REPLICA_STICKY_SECONDS=60)
+        tester, h = self.auth_headers(app)
+        self.replicate(app)
+
+        self.assertEqual(self.add_category(tester, h).status_code, 201)
+        self.assertEqual(['breakfast'], [c['category_name'] for c in self.categories(tester, h)])
+
+    def test_fresh_token_reads_from_the_primary(self):
+        """Tests that a user who just registered and logged in is not rejected by a lagging replica."""
+        app = self.create_app()
+        tester, h = self.auth_headers(app)
+        # the user was never replicated
+        self.assertEqual(tester.get('/api-v0/category', headers=h).status_code, 200)
+
+    def test_principal_lookup_reads_the_replica(self):
+        """Tests that token_required resolves the user on the replica once the sticky window is over."""
+        app = self.create_app(REPLICA_STICKY_SECONDS=0)
+        tester, h = self.auth_headers(app)
+        self.assertEqual(tester.get('/api-v0/category', headers=h).status_code, 401)
+        self.replicate(app)
+        self.assertEqual(tester.get('/api-v0/category', headers=h).status_code, 200)
+
+    def test_round_robin(self):
+        """Tests that sessions alternate between the replicas."""
+        app = self.create_app()
+        app.config['SQLALCHEMY_REPLICA_URIS'] = ['sqlite:///' + self.replica] * 2
+        app.config['SQLALCHEMY_BINDS']['replica_1'] = 'sqlite:///' + self.replica
+        with app.app_context():
+            first, second, third = [choose_replica(db, app) for _ in range(3)]
+        self.assertIsNot(first, second)
+        self.assertIs(first, third)
@@ -0,0 +1,83 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.helpers import principal_cache
+from app.search import indexes
+
+SQLITE_CONFIG = {
+    'TESTING': True,
+    'SECRET_KEY': 'Ochunglobotho',
+    'JOBS_IN_PROCESS': False,
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+}
+
+class SQLiteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        principal_cache.clear()
+        indexes.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_app(self, uri):
+        config = dict(SQLITE_CONFIG, SQLALCHEMY_DATABASE_URI=uri,
+                      RESPONSE_CACHE_PATH=os.path.join(self.directory, 'cache.sqlite'))
+        app = create_app(config)
+        with app.app_context():
+            db.create_all()
+        return app
+
+    def pragma(self, app, name):
+        with app.app_context():
+            return db.session.execute('PRAGMA {}'.format(name)).scalar()
+
+    def test_file_database_pragmas(self):
+        """Tests that file databases are opened in WAL mode with the tuned pragmas."""
+        app = self.create_app('sqlite:///' + os.path.join(self.directory, 'chumvi.sqlite'))
+        self.assertEqual(self.pragma(app, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(app, 'synchronous'), 1)
+        self.assertEqual(self.pragma(app, 'foreign_keys'), 1)
+        self.assertEqual(self.pragma(app, 'busy_timeout'), 5000)
+
+    def test_connection_per_thread(self):
+        """Tests that a thread keeps its connection across checkouts."""
+        app = self.create_app('sqlite:///' + os.path.join(self.directory, 'chumvi.sqlite'))
+        with app.app_context():
+            first = db.engine.raw_connection()
+            connection = first.connection
+            first.close()
+            second = db.engine.raw_connection()
+            self.assertIs(second.connection, connection)
+            second.close()
+
+    def test_in_memory_apps_are_isolated(self):
+        """Tests that every in memory application gets its own database."""
+        first = self.create_app('sqlite://')
+        second = self.create_app('sqlite://')
+        registration = {'username': 'testuser', 'email': 'test@example.com', 'password': 'Osupportit.0'}
+        res = first.test_client().post('/api-v0/auth/register', data=json.dumps(registration), content_type='application/json')
+        self.assertEqual(res.status_code, 201)
+        res = second.test_client().post('/api-v0/auth/login', data=json.dumps(registration), content_type='application/json')
+        self.assertEqual(res.status_code, 422)
+        res = first.test_client().post('/api-v0/auth/login', data=json.dumps(registration), content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+
+    def test_caches_follow_the_app_config(self):
+        """Tests that the module level caches are sized by the config of the app."""
+        app = self.create_app('sqlite://')
+        app.config.update(PRINCIPAL_CACHE_SIZE=0, SEARCH_INDEX_USERS=0)
+        tester = app.test_client()
+        registration = {'username': 'testuser', 'email': 'test@example.com', 'password': 'Osupportit.0'}
+        tester.post('/api-v0/auth/register', data=json.dumps(registration), content_type='application/json')
+        res = tester.post('/api-v0/auth/login', data=json.dumps(registration), content_type='application/json')
+        h = {'x-access-token': json.loads(res.data)['token']}
+        self.assertEqual(tester.get('/api-v0/recipe/search?q=maize', headers=h).status_code, 200)
+        self.assertEqual(0, len(principal_cache))
+        self.assertEqual(0, len(indexes))
+
+if __name__ == '__main__':
+    unittest.main()
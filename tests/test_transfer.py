@@ -0,0 +1,83 @@
+import gzip
+import json
+from sqlalchemy import event
+from werkzeug.datastructures import Headers
+from tests import ApiTestCase
+from app import app, db
+from app.models import Recipe
+
+class TransferTestCase(ApiTestCase):
+    def auth_headers(self):
+        """Register, login and return the token headers."""
+        self.register()
+        res = self.tester.post('/api-v0/auth/login', data=json.dumps(self.login_data), content_type='application/json')
+        h = Headers()
+        h.add('x-access-token', json.loads(res.data)['token'])
+        return h
+
+    def test_export(self):
+        """Tests NDJSON export of categories and recipes."""
+        h = self.auth_headers()
+        self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
+        recipe = {'title': 'Maindi Choma', 'ingredients': 'Maindi Ndimu', 'steps': 'Choma maindi', 'category_id': 1}
+        self.tester.post('/api-v0/recipe', data=json.dumps(recipe), content_type='application/json', headers=h)
+
+        response = self.tester.get('/api-v0/export', headers=h)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(['category', 'recipe'], [line['type'] for line in lines])
+        self.assertEqual('maindi choma', lines[1]['title'])
+
+        response = self.tester.get('/api-v0/export?gzip=1', headers=h)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual(2, len(gzip.decompress(response.data).splitlines()))
+
+    def test_import(self):
+        """Tests NDJSON import with remapped category ids and per line errors."""
+        h = self.auth_headers()
+        lines = [
+            {'type': 'category', 'id': 42, 'category_name': 'Breakfast', 'category_description': 'Awesome Breakfast'},
+            {'type': 'recipe', 'title': 'maindi choma', 'ingredients': 'Maindi Ndimu', 'steps': 'Choma maindi', 'category_id': 42},
+            {'type': 'recipe', 'title': 'maindi choma', 'ingredients': 'Maindi Ndimu', 'steps': 'Choma maindi', 'category_id': 42},
+            {'type': 'recipe', 'title': 'ug', 'ingredients': 'Maize flour', 'steps': 'Cook ugali', 'category_id': 42},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+        response = self.tester.post('/api-v0/import', data=body, content_type='application/x-ndjson', headers=h)
+        resp = json.loads(response.data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({'inserted': 1, 'skipped': 0}, resp['summary']['categories'])
+        self.assertEqual({'inserted': 1, 'skipped': 2}, resp['summary']['recipes'])
+        self.assertEqual([4, 5], sorted(e['line'] for e in resp['summary']['errors']))
+
+        response = self.tester.get('/api-v0/recipe/1', headers=h)
+        self.assertEqual(1, json.loads(response.data)['recipe']['category_id'])
+
+    def test_import_batch_conflict(self):
+        """Tests that a batch conflicting with a concurrent write is rolled back and reported."""
+        h = self.auth_headers()
+        lines = [
+            {'type': 'category', 'id': 42, 'category_name': 'Breakfast', 'category_description': 'Awesome Breakfast'},
+            {'type': 'recipe', 'title': 'maindi choma', 'ingredients': 'Maindi Ndimu', 'steps': 'Choma maindi', 'category_id': 42},
+            {'type': 'recipe', 'title': 'ugali sukuma', 'ingredients': 'Maize flour', 'steps': 'Cook ugali', 'category_id': 42},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n'
+        inserted = []
+
+        def insert(conn, cursor, statement, parameters, context, executemany):
+            # a concurrent request adds the first recipe right before the import does
+            if 'INTO recipes' in statement and not inserted:
+                inserted.append(True)
+                conn.execute(Recipe.__table__.insert(), title='maindi choma', ingredients='Maindi',
+                             steps='Choma', category_id=1, user_id=1)
+        batch_size, app.config['IMPORT_BATCH_SIZE'] = app.config.get('IMPORT_BATCH_SIZE'), 1
+        event.listen(db.engine, 'before_cursor_execute', insert)
+        try:
+            response = self.tester.post('/api-v0/import', data=body, content_type='application/x-ndjson', headers=h)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', insert)
+            app.config['IMPORT_BATCH_SIZE'] = batch_size
+        resp = json.loads(response.data)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({'inserted': 1, 'skipped': 0}, resp['summary']['categories'])
+        self.assertEqual({'inserted': 1, 'skipped': 1}, resp['summary']['recipes'])
+        self.assertEqual([2], [e['line'] for e in resp['summary']['errors']])
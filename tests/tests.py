@@ -1,9 +1,13 @@
 import jwt
 import json
 import unittest
+from contextlib import contextmanager
 from werkzeug.datastructures import Headers
 import app
 from app import app, db, models
+from app.response_cache import response_cache
+from app.search import indexes
+from app.instrumentation import count_queries
 
 User = models.User
 Category = models.Category
@@ -17,6 +21,9 @@ class ApiTestCase(unittest.TestCase):
         self.registration_data = {'username': 'testuser', 'email': 'test@example.com', 'password': 'Osupportit.0'}
         app.config.from_pyfile('testconf.cfg')        
         db.create_all()
+        # user ids are reused once the tables are recreated
+        response_cache.clear(app)
+        indexes.clear()
 
     def register(self):
         """User registration helper"""
@@ -34,6 +41,13 @@ class ApiTestCase(unittest.TestCase):
         h.add('x-access-token', data['token'])
         return self.tester.post('/api-v0/category', data=json.dumps(self.category_data), content_type='application/json', headers=h)
 
+    @contextmanager
+    def assertMaxQueries(self, count):
+        """Fail when the block issues more than count SQL statements."""
+        with count_queries() as statements:
+            yield
+        self.assertLessEqual(len(statements), count, '\n'.join(statements))
+
     def tearDown(self):
         db.session.remove()
         db.drop_all()